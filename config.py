@@ -1,3 +0,0 @@
-import os
-
-root_dir = os.path.dirname(os.path.abspath(__file__))
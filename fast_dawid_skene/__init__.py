@@ -1,6 +1,6 @@
-import os
-import sys
+"""
+Fast Dawid-Skene, Dawid-Skene, Hybrid and Majority Voting algorithms to
+aggregate crowdsourced annotations.
+"""
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, current_dir)
-sys.path.insert(0, os.path.join(current_dir, '..'))
+__version__ = '0.1.0'
@@ -0,0 +1,190 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+
+def entropy(question_classes):
+    """
+    Compute the entropy of the posterior of each question
+
+    Args:
+        question_classes: Posterior probability of each class for each
+            question: [questions x classes]
+
+    Returns:
+        Entropy of each posterior, in nats: [questions]
+    """
+    question_classes = np.asarray(question_classes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = question_classes * np.log(question_classes)
+    return -np.sum(np.where(question_classes > 0, terms, 0.0), 1)
+
+
+def margin(question_classes):
+    """
+    Compute the margin between the two most likely classes of each question
+
+    Args:
+        question_classes: Posterior probability of each class for each
+            question: [questions x classes]
+
+    Returns:
+        Difference between the largest and the second largest posterior
+        probability of each question: [questions]
+    """
+    question_classes = np.asarray(question_classes)
+    if np.shape(question_classes)[1] < 2:
+        return question_classes[:, 0].copy()
+    top_two = np.partition(question_classes, -2, axis=1)[:, -2:]
+    return top_two[:, 1] - top_two[:, 0]
+
+
+def expected_error_reduction(question_classes, error_rates, workers=None):
+    """
+    Compute the expected reduction in the probability of error of each
+    question if it were labelled once more by each worker
+
+    The probability of error of a question is one minus its largest posterior
+    probability. If worker k labels question i as l, the posterior becomes
+    proportional to p_ij pi_kjl, so the expected probability of error after
+    the label is 1 - sum_l max_j p_ij pi_kjl.
+
+    Args:
+        question_classes: Posterior probability of each class for each
+            question: [questions x classes]
+        error_rates: probability of participant k assigning a question whose correct
+            label is j the label l: [participants x classes x classes]
+        workers: Indices of the participants to consider. All participants
+            are considered if None
+
+    Returns:
+        Expected reduction in the probability of error: [questions x workers]
+    """
+    question_classes = np.asarray(question_classes)
+    if workers is not None:
+        error_rates = error_rates[workers]
+    nClasses = np.shape(question_classes)[1]
+
+    # loop over the pairs of classes, so that the temporaries are
+    # [questions x workers] rather than [questions x workers x classes x classes]
+    reductions = -np.max(question_classes, 1)[:, np.newaxis] * \
+        np.ones(len(error_rates))
+    best_joint = np.empty_like(reductions)
+    joint = np.empty_like(reductions)
+    for l in range(nClasses):
+        best_joint.fill(0.0)
+        for j in range(nClasses):
+            np.multiply(question_classes[:, j, np.newaxis],
+                        error_rates[:, j, l], out=joint)
+            np.maximum(best_joint, joint, out=best_joint)
+        reductions += best_joint
+    return reductions
+
+
+def recommend(question_classes, error_rates, n, annotations=None,
+              workers=None, max_elements=2 ** 20):
+    """
+    Rank the questions where one more label would most reduce the expected
+    probability of error
+
+    Each question is paired with the worker whose label would reduce its
+    expected probability of error the most (see expected_error_reduction), and
+    the n questions with the largest reductions are returned. Questions are
+    processed in batches, so that the intermediate arrays have at most about
+    max_elements elements.
+
+    Args:
+        question_classes: Posterior probability of each class for each
+            question: [questions x classes]
+        error_rates: probability of participant k assigning a question whose correct
+            label is j the label l: [participants x classes x classes]
+        n: Number of questions to recommend
+        annotations: Existing annotations, as returned by
+            responses_to_annotations, with a row (question, participant, class)
+            for each response: [responses x 3]. Workers are not recommended
+            for questions they have already labelled. Ignored if None
+        workers: Indices of the participants available for labelling. All
+            participants are available if None
+        max_elements: Bound on the number of elements of intermediate arrays
+
+    Returns:
+        questions: Indices of the recommended questions, in decreasing order
+            of expected reduction in the probability of error: [n]
+        workers: Index of the best available worker for each question: [n]
+        gains: Expected reduction in the probability of error: [n]
+    """
+    assert n > 0, "Number of questions to recommend must be a positive integer"
+    question_classes = np.asarray(question_classes)
+    [nQuestions, nClasses] = np.shape(question_classes)
+    nParticipants = np.shape(error_rates)[0]
+    if workers is None:
+        workers = np.arange(nParticipants)
+    workers = np.asarray(workers, dtype=np.int64)
+    candidate_error_rates = error_rates[workers]
+
+    # position of each participant among the workers, or -1
+    positions = np.full(nParticipants, -1, dtype=np.int64)
+    positions[workers] = np.arange(len(workers))
+    if annotations is not None:
+        annotations = np.asarray(annotations)
+        annotations = annotations[positions[annotations[:, 1]] >= 0]
+        annotations = annotations[np.argsort(annotations[:, 0], kind='mergesort')]
+
+    batch_size = max(1, max_elements // max(1, len(workers)))
+
+    best_questions = np.empty(0, dtype=np.int64)
+    best_workers = np.empty(0, dtype=np.int64)
+    best_gains = np.empty(0)
+    if len(workers) == 0:
+        nQuestions = 0
+    for start in range(0, nQuestions, batch_size):
+        stop = min(start + batch_size, nQuestions)
+        gains = expected_error_reduction(
+            question_classes[start:stop], candidate_error_rates)
+        if annotations is not None:
+            lo, hi = np.searchsorted(annotations[:, 0], [start, stop])
+            gains[annotations[lo:hi, 0] - start,
+                  positions[annotations[lo:hi, 1]]] = -np.inf
+
+        batch_workers = np.argmax(gains, 1)
+        batch_gains = gains[np.arange(stop - start), batch_workers]
+
+        best_questions = np.concatenate(
+            [best_questions, np.arange(start, stop)])
+        best_workers = np.concatenate([best_workers, workers[batch_workers]])
+        best_gains = np.concatenate([best_gains, batch_gains])
+        if len(best_gains) > n:
+            keep = np.argpartition(-best_gains, n - 1)[:n]
+            best_questions = best_questions[keep]
+            best_workers = best_workers[keep]
+            best_gains = best_gains[keep]
+
+    # questions without any available worker are never recommended
+    available = np.isfinite(best_gains)
+    best_questions = best_questions[available]
+    best_workers = best_workers[available]
+    best_gains = best_gains[available]
+    order = np.lexsort((best_questions, -best_gains))
+    return (best_questions[order], best_workers[order], best_gains[order])
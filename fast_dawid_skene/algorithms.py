@@ -23,8 +23,10 @@ from __future__ import print_function
 
 import numpy as np
 
+from . import kernels
 
-def main(args, data, gold=None):
+
+def main(args, data, gold=None, return_estimates=False, estimator=None):
     """
     Run the EM estimator on the data passed as the parameter
 
@@ -33,27 +35,43 @@ def main(args, data, gold=None):
             among ['FDS','DS','H','MV']
             And should contain verbose whose value should be either True or False
         data: a dictionary object of crwod-sourced responses:
-            {questions: {participants: [labels]}}
+            {questions: {participants: [labels]}}, or the data taken by
+            estimator
         gold: The correct label for each question: [nQuestions]
+        return_estimates: whether to also return the posteriors and the
+            fitted parameters (see run)
+        estimator: Function to run the aggregator on data with, called as
+            estimator(data, args=args, return_estimates=return_estimates).
+            Default is run. Use shards.run, or a functools.partial of it
+            giving its other arguments, for a ShardStore
 
     Returns:
         result: The estimated label for each question: [nQuestions]
         acc: Accuracy of the estimated labels if gold was specified
+        If return_estimates is set, also
+            estimates: (question_classes, p_j, pi_kjl) tuple (see run)
     """
 
     assert args.algorithm in ['FDS', 'DS', 'H', 'MV'], 'Invalid algorithm'
 
-    result = run(data, args=args)
+    if estimator is None:
+        estimator = run
+    result = estimator(data, args=args, return_estimates=return_estimates)
+    if return_estimates:
+        (result, estimates) = (result[0], result[1:])
 
     if gold is not None:
         acc = (gold == result).mean()
     else:
         acc = None
 
+    if return_estimates:
+        return result, acc, estimates
     return result, acc
 
 
-def run(responses, args, tol=0.0001, CM_tol=0.005, max_iter=100):
+def run(responses, args, tol=0.0001, CM_tol=0.005, max_iter=100,
+        return_estimates=False, rng=None):
     """
     Run the aggregator on response data
 
@@ -67,35 +85,170 @@ def run(responses, args, tol=0.0001, CM_tol=0.005, max_iter=100):
             'H': use for Hybrid algorithm
             'MV': use for Majority Voting
             And should contain verbose whose value should be either True or False
+            May contain backend whose value should be one among
+            ['reference', 'numpy', 'numba']
+            'reference': use the loops over the count array (default)
+            'numpy', 'numba': use the kernels over sparse annotations
+            May contain smoothing, the non-negative pseudo-count added to the
+            error rate counts (see m_step), default 0
+            May contain pool_threshold, the number of annotations below which
+            participants share a pooled confusion matrix (see
+            pool_participants), default 0
         tol: threshold for class marginals for convergence of the algorithm
         CM_tol: threshold for class marginals for switching to 'hard' mode
             in Hybrid algorithm. Has no effect for FDS or DS
         max_iter: maximum number of iterations of EM
+        return_estimates: whether to also return the fitted parameters and
+            the posteriors computed from them
+        rng: numpy Generator, SeedSequence or integer seed to break ties with
+            (see make_seed_sequence). Defaults to the seed in args if it
+            contains one, or to fresh entropy otherwise
 
     Returns:
         The estimated label for each question: [nQuestions]
+        If return_estimates is set, also
+            question_classes: posterior probability of each class for each
+                question, even for the algorithms that make hard
+                assignments: [questions x classes]
+            p_j: class marginals [classes]
+            pi_kjl: error rates [participants, classes, classes]. Pooled
+                participants share the same rows
+            For 'MV', the parameters are estimated from the majority votes
     """
 
-    mode = args.algorithm
-
-    # convert responses to counts
-    (questions, participants, classes, counts) = responses_to_counts(responses)
+    backend = getattr(args, 'backend', 'reference')
+    smoothing = getattr(args, 'smoothing', 0.0)
+    pool_threshold = getattr(args, 'pool_threshold', 0)
+    assert smoothing >= 0, "Smoothing must be a non-negative pseudo-count!"
+    if rng is None:
+        rng = getattr(args, 'seed', None)
+    seed_sequence = make_seed_sequence(rng)
+
+    if backend == 'reference':
+        # convert responses to counts
+        (questions, participants, classes,
+         counts) = responses_to_counts(responses)
+    else:
+        (questions, participants, classes,
+         annotations) = responses_to_annotations(responses)
+    if backend == 'reference':
+        groups = pool_participants(np.sum(counts, (0, 2)), pool_threshold)
+        nGroups = int(np.max(groups)) + 1
+        if nGroups < len(participants):
+            pooled_counts = np.zeros([len(questions), nGroups, len(classes)])
+            np.add.at(pooled_counts, (slice(None), groups), counts)
+            counts = pooled_counts
+    else:
+        groups = pool_participants(np.bincount(
+            annotations[:, 1], minlength=len(participants)), pool_threshold)
+        nGroups = int(np.max(groups)) + 1
+        if nGroups < len(participants):
+            annotations = annotations.copy()
+            annotations[:, 1] = groups[annotations[:, 1]]
     if args.verbose:
         print("Number of Questions:", len(questions))
         print("Number of Participants:", len(participants))
+        if nGroups < len(participants):
+            print("Number of Confusion Matrices:", nGroups)
         print("Classes:", classes)
 
-    question_classes = initialize(counts, mode)
+    def initial_estimates(mode):
+        rng = make_generator(step_seed_sequence(seed_sequence, 0))
+        if backend == 'reference':
+            return initialize(counts, mode, rng)
+        return initialize_sums(kernels.response_sums(
+            annotations, len(questions), len(classes)), mode, rng)
+
+    def map_reduce(step, mode, params):
+        # all the questions are in a single shard, held in memory
+        (class_marginals, error_rates) = params
+        rng = make_generator(step_seed_sequence(seed_sequence, step))
+        if backend == 'reference':
+            question_classes = e_step(
+                counts, class_marginals, error_rates, mode, rng)
+            return (question_classes,
+                    calc_likelihood(counts, class_marginals, error_rates))
+        return e_step_sparse(annotations, class_marginals, error_rates, mode,
+                             len(questions), rng, backend)
+
+    def maximize(question_classes):
+        if backend == 'reference':
+            return m_step(counts, question_classes, smoothing)
+        return m_step_sparse(annotations, question_classes, nGroups, backend,
+                             smoothing)
+
+    (question_classes, class_marginals, error_rates, nIter, mode) = em(
+        initial_estimates, map_reduce, maximize, args, tol, CM_tol, max_iter,
+        return_estimates)
+
+    result = np.argmax(question_classes, axis=1)
+    if not return_estimates:
+        return result
+
+    if mode != 'DS' and mode != 'H':
+        # posteriors from the parameters, even for the algorithms that make
+        # hard assignments in the C step
+        question_classes = map_reduce(
+            nIter + 1, 'DS', (class_marginals, error_rates))[0]
+    return (result, question_classes, class_marginals, error_rates[groups])
+
+
+def em(initialize, map_reduce, m_step, args, tol=0.0001, CM_tol=0.005,
+       max_iter=100, fit_majority_vote=True):
+    """
+    Run the iterations of the EM algorithm
+
+    The driver of both run, over responses held in memory, and shards.run,
+    over on-disk shards, which only differ in how the steps are computed. The
+    steps pass statistics of the estimates of the true classes from the E step
+    to the M step, which are the estimates themselves for run, and their sums
+    over the shards for shards.run.
+
+    Args:
+        initialize: Function of the mode giving the statistics of the initial
+            estimates of the true classes (see initialize)
+        map_reduce: Function of the step, the mode and the parameters
+            (p_j, pi_kjl) performing the E (+ C) step (see e_step) with the
+            random stream of the step (see step_seed_sequence), giving the
+            statistics of the new estimates and the log-likelihood of the
+            parameters
+        m_step: Function of the statistics giving the parameters
+            (p_j, pi_kjl) (see m_step)
+        args: Must contain algorithm whose value should be
+            one among ['FDS','DS','H','MV']
+            And should contain verbose whose value should be either True or False
+        tol: threshold for class marginals for convergence of the algorithm
+        CM_tol: threshold for class marginals for switching to 'hard' mode
+            in Hybrid algorithm. Has no effect for FDS or DS
+        max_iter: maximum number of iterations of EM
+        fit_majority_vote: whether to estimate the parameters from the
+            majority votes for 'MV'
+
+    Returns:
+        statistics: Statistics of the last estimates of the true classes
+        p_j: class marginals [classes], None for 'MV' unless
+            fit_majority_vote is set
+        pi_kjl: error rates [participants, classes, classes], None for 'MV'
+            unless fit_majority_vote is set
+        nIter: Number of iterations, 0 for 'MV'
+        mode: Mode of the last E step, 'Hphase2' if the Hybrid algorithm
+            switched to hard assignments
+    """
+
+    mode = args.algorithm
+    statistics = initialize(mode)
 
     if mode == 'MV':
-        return np.argmax(question_classes, axis=1)
+        if not fit_majority_vote:
+            return statistics, None, None, 0, mode
+        (class_marginals, error_rates) = m_step(statistics)
+        return statistics, class_marginals, error_rates, 0, mode
 
     # initialize
     nIter = 0
     converged = False
     old_class_marginals = None
     old_error_rates = None
-    # total_time = 0
 
     if args.verbose:
         print("Iter\tlog-likelihood\tdelta-CM\tdelta-ER")
@@ -103,21 +256,12 @@ def run(responses, args, tol=0.0001, CM_tol=0.005, max_iter=100):
     while not converged:
         nIter += 1
 
-        # Start measuring time
-        # start = time.time()
-
         # M-step
-        (class_marginals, error_rates) = m_step(counts, question_classes)
+        (class_marginals, error_rates) = m_step(statistics)
 
         # E-step
-        question_classes = e_step(counts, class_marginals, error_rates, mode)
-
-        # End measuring time
-        # end = time.time()
-        # total_time += end-start
-
-        # check likelihood
-        log_L = calc_likelihood(counts, class_marginals, error_rates)
+        (statistics, log_L) = map_reduce(
+            nIter, mode, (class_marginals, error_rates))
 
         # check for convergence
         if old_class_marginals is not None:
@@ -145,9 +289,7 @@ def run(responses, args, tol=0.0001, CM_tol=0.005, max_iter=100):
         print("Class marginals")
         print(class_marginals)
 
-    result = np.argmax(question_classes, axis=1)
-
-    return result
+    return statistics, class_marginals, error_rates, nIter, mode
 
 
 def responses_to_counts(responses):
@@ -201,7 +343,47 @@ def responses_to_counts(responses):
     return (questions, participants, classes, counts)
 
 
-def initialize(counts, mode):
+def responses_to_annotations(responses):
+    """
+    Convert a matrix of annotations to sparse annotation data
+
+    Args:
+        responses: dictionary of responses {questions:{participants:[responses]}}
+
+    Returns:
+        questions: list of questions
+        participants: list of participants
+        classes: list of possible classes (choices)
+        annotations: array with a row (question, participant, class) of
+            indices for each response: [responses x 3]
+    """
+    questions = sorted(responses.keys())
+
+    participants = set()
+    classes = set()
+    for i in questions:
+        for k in responses[i].keys():
+            participants.add(k)
+            classes.update(responses[i][k])
+    participants = sorted(participants)
+    classes = sorted(classes)
+
+    participant_indices = dict((k, index)
+                               for index, k in enumerate(participants))
+    class_indices = dict((j, index) for index, j in enumerate(classes))
+
+    annotations = []
+    for i, question in enumerate(questions):
+        for participant in responses[question].keys():
+            k = participant_indices[participant]
+            for response in responses[question][participant]:
+                annotations.append((i, k, class_indices[response]))
+    annotations = np.array(annotations, dtype=np.int64).reshape(-1, 3)
+
+    return (questions, participants, classes, annotations)
+
+
+def initialize(counts, mode, rng=None):
     """
     Get majority voting estimates for the true classes using counts
 
@@ -214,28 +396,43 @@ def initialize(counts, mode):
             'FDS': use for FDS algorithm
             'DS': use for original DS algorithm
             'H': use for Hybrid algorithm
+        rng: numpy Generator used to break ties (see hard_assign)
 
     Returns:
         question_classes: matrix of estimates of true classes:
             [questions x responses] 
     """
-    [nQuestions, nParticipants, nClasses] = np.shape(counts)
     response_sums = np.sum(counts, 1)
-    question_classes = np.zeros([nQuestions, nClasses])
+    return initialize_sums(response_sums, mode, rng)
+
+
+def initialize_sums(response_sums, mode, rng=None):
+    """
+    Get the initial estimates for the true classes from response counts
+
+    See initialize
+
+    Args:
+        response_sums: number of times each response was received by each
+            question: [questions x classes]
+        mode: One among ['FDS', 'DS', 'H', 'MV']
+        rng: numpy Generator used to break ties (see hard_assign)
+
+    Returns:
+        question_classes: matrix of estimates of true classes:
+            [questions x responses]
+    """
+    [nQuestions, nClasses] = np.shape(response_sums)
     if mode == 'FDS' or mode == 'MV':
-        for p in range(nQuestions):
-            indices = np.argwhere(response_sums[p, :] == np.max(
-                response_sums[p, :])).flatten()
-            question_classes[p, np.random.choice(indices)] = 1
-    else:
-        for p in range(nQuestions):
-            question_classes[p, :] = response_sums[p, :] / \
-                np.sum(response_sums[p, :], dtype=float)
+        return hard_assign(response_sums, rng)
 
-    return question_classes
+    question_sums = np.sum(response_sums, 1, keepdims=True)
+    return np.divide(response_sums, question_sums.astype(float),
+                     out=np.zeros([nQuestions, nClasses]),
+                     where=question_sums > 0)
 
 
-def m_step(counts, question_classes):
+def m_step(counts, question_classes, smoothing=0.0):
     """
     M Step for the EM algorithm
 
@@ -244,11 +441,18 @@ def m_step(counts, question_classes):
     See equations 2.3 and 2.4 in Dawid-Skene (1979) or equations 3 and 4 in 
     our paper (Fast Dawid-Skene: A Fast Vote Aggregation Scheme for Sentiment 
     Classification)
+    With smoothing, smoothing pseudo-counts are added to every response, so
+    that rows of participants with few labels are not degenerate. The error
+    rates are then MAP estimates under a symmetric Dirichlet prior on each row
+    whose concentration is smoothing + 1, since the MAP estimate under a
+    Dirichlet(alpha) prior adds alpha - 1.
 
     Args: 
         counts: Array of how many times each response was received
             by each question from each participant: [questions x participants x classes]
         question_classes: Matrix of current assignments of questions to classes
+        smoothing: Non-negative pseudo-count added to each error rate count,
+            not the Dirichlet concentration. 0 for MLE
 
     Returns:
         p_j: class marginals - the probability that the correct answer of a question
@@ -268,7 +472,7 @@ def m_step(counts, question_classes):
         for j in range(nClasses):
             for l in range(nClasses):
                 error_rates[k, j, l] = np.dot(
-                    question_classes[:, j], counts[:, k, l])
+                    question_classes[:, j], counts[:, k, l]) + smoothing
             sum_over_responses = np.sum(error_rates[k, j, :])
             if sum_over_responses > 0:
                 error_rates[k, j, :] = error_rates[
@@ -277,7 +481,7 @@ def m_step(counts, question_classes):
     return (class_marginals, error_rates)
 
 
-def e_step(counts, class_marginals, error_rates, mode):
+def e_step(counts, class_marginals, error_rates, mode, rng=None):
     """
     E (+ C) Step for the EM algorithm
 
@@ -300,6 +504,8 @@ def e_step(counts, class_marginals, error_rates, mode):
             'FDS': use for FDS algorithm
             'DS': use for original DS algorithm
             'H' and 'Hphase2': use for Hybrid algorithm
+        rng: numpy Generator used to break ties in the C step (see
+            hard_assign)
 
     Returns:
         question_classes: Assignments of labels to questions
@@ -309,7 +515,6 @@ def e_step(counts, class_marginals, error_rates, mode):
     [nQuestions, nParticipants, nClasses] = np.shape(counts)
 
     question_classes = np.zeros([nQuestions, nClasses])
-    final_classes = np.zeros([nQuestions, nClasses])
 
     for i in range(nQuestions):
         for j in range(nClasses):
@@ -323,15 +528,206 @@ def e_step(counts, class_marginals, error_rates, mode):
             if question_sum > 0:
                 question_classes[i, :] = question_classes[
                     i, :] / float(question_sum)
-        else:
-            indices = np.argwhere(question_classes[i, :] == np.max(
-                question_classes[i, :])).flatten()
-            final_classes[i, np.random.choice(indices)] = 1
 
     if mode == 'H' or mode == 'DS':
         return question_classes
     else:
-        return final_classes
+        return hard_assign(question_classes, rng)
+
+
+def m_step_sparse(annotations, question_classes, nParticipants,
+                  backend='numpy', smoothing=0.0):
+    """
+    M Step for the EM algorithm over sparse annotations
+
+    See m_step
+
+    Args:
+        annotations: array with a row (question, participant, class) for each
+            response: [responses x 3]
+        question_classes: Matrix of current assignments of questions to classes
+        nParticipants: Number of participants
+        backend: One among ['numpy', 'numba']
+        smoothing: Non-negative pseudo-count added to each error rate count,
+            not the Dirichlet concentration (see m_step). 0 for MLE
+
+    Returns:
+        p_j: class marginals [classes]
+        pi_kjl: error rates [participants, classes, classes]
+    """
+    (class_sums, error_counts) = kernels.accumulate(
+        annotations, question_classes, nParticipants, backend)
+    return kernels.normalize_statistics(
+        class_sums, error_counts, len(question_classes), smoothing)
+
+
+def pool_participants(participant_counts, min_annotations):
+    """
+    Group the participants that share a confusion matrix
+
+    Participants with at least min_annotations annotations get a confusion
+    matrix of their own. The remaining participants are pooled into a single
+    group, whose class-conditional confusion matrix is estimated from all of
+    their annotations. This stabilizes the estimates for participants with
+    only a few annotations, and needs one matrix rather than one for each.
+
+    Args:
+        participant_counts: Number of annotations of each participant:
+            [participants]
+        min_annotations: Number of annotations below which participants are
+            pooled. 0 for no pooling
+
+    Returns:
+        groups: Index of the confusion matrix of each participant:
+            [participants]. The pooled group, if any, is the last
+    """
+    participant_counts = np.asarray(participant_counts)
+    kept = participant_counts >= min_annotations
+    groups = np.cumsum(kept) - 1
+    groups[~kept] = np.sum(kept)
+    return groups
+
+
+def e_step_sparse(annotations, class_marginals, error_rates, mode,
+                  nQuestions=None, rng=None, backend='numpy'):
+    """
+    E (+ C) Step for the EM algorithm over sparse annotations
+
+    See e_step. The computation is done in the log domain, and also gives the
+    log-likelihood (see calc_likelihood).
+
+    Args:
+        annotations: array with a row (question, participant, class) for each
+            response: [responses x 3]
+        class_marginals: probability of a random question belonging to each class: [classes]
+        error_rates: probability of participant k assigning a question whose correct
+            label is j the label l: [participants x classes x classes]
+        mode: One among ['H', 'Hphase2', 'FDS', 'DS']
+        nQuestions: Number of questions. Inferred from annotations if None
+        rng: numpy Generator used to break ties in the C step (see
+            hard_assign)
+        backend: One among ['numpy', 'numba']
+
+    Returns:
+        question_classes: Assignments of labels to questions
+            [questions x classes]
+        log_L: Likelihood given current parameter estimates
+    """
+    if nQuestions is None:
+        nQuestions = int(np.max(annotations[:, 0])) + 1
+    log_joint = kernels.log_joint(
+        annotations, nQuestions, class_marginals, error_rates, backend)
+    (question_classes, log_L) = kernels.posteriors(log_joint, backend)
+
+    if mode == 'H' or mode == 'DS':
+        return question_classes, log_L
+    else:
+        return hard_assign(log_joint, rng), log_L
+
+
+def hard_assign(scores, rng=None):
+    """
+    Assign each question to its highest scoring class
+
+    Used for the majority voting initialization and for the C step of FDS.
+    Ties between classes with the maximum score are broken uniformly at random.
+    All questions are handled in one batch, drawing a single uniform number
+    per question, which selects the r-th of its tied classes. Since exactly
+    one number is drawn per question, assigning consecutive blocks of
+    questions with one generator gives the same result as a single call.
+
+    Args:
+        scores: Score of each class for each question, for instance vote
+            counts or posterior probabilities: [questions x classes]
+        rng: numpy Generator used to break ties, or a seed to create one
+            from. Fresh entropy is used if None
+
+    Returns:
+        question_classes: One-hot assignments of labels to questions
+            [questions x classes]
+    """
+    rng = np.random.default_rng(rng)
+
+    [nQuestions, nClasses] = np.shape(scores)
+    question_classes = np.zeros([nQuestions, nClasses])
+    if nQuestions == 0 or nClasses == 0:
+        return question_classes
+
+    is_max = scores == np.max(scores, 1, keepdims=True)
+    ranks = np.cumsum(is_max, 1)
+    picks = (rng.random(nQuestions) * ranks[:, -1]).astype(np.int64)
+    picks += 1
+    choices = np.argmax(is_max & (ranks == picks[:, np.newaxis]), 1)
+    question_classes[np.arange(nQuestions), choices] = 1
+
+    return question_classes
+
+
+def make_seed_sequence(rng=None):
+    """
+    Get the root SeedSequence of a run
+
+    Each step of EM that may break ties uses an independent child of the
+    root (see step_seed_sequence), so that the random numbers of a step do
+    not depend on how many were drawn in the steps before it.
+
+    Args:
+        rng: numpy SeedSequence, which is returned as is, numpy Generator to
+            draw the entropy of the root from, integer seed, or None for
+            fresh entropy
+
+    Returns:
+        The root SeedSequence
+    """
+    if isinstance(rng, np.random.SeedSequence):
+        return rng
+    if isinstance(rng, np.random.Generator):
+        return np.random.SeedSequence(rng.integers(2 ** 63, size=4))
+    return np.random.SeedSequence(rng)
+
+
+def step_seed_sequence(seed_sequence, step):
+    """
+    Get the SeedSequence of a step of EM
+
+    Unlike SeedSequence.spawn, this does not change the root, so a root can
+    be reused to repeat a run.
+
+    Args:
+        seed_sequence: Root SeedSequence of the run (see make_seed_sequence)
+        step: Index of the step, 0 for the initialization and the number of
+            the iteration otherwise
+
+    Returns:
+        The child SeedSequence of the root for the step
+    """
+    return np.random.SeedSequence(
+        seed_sequence.entropy,
+        spawn_key=tuple(seed_sequence.spawn_key) + (step,),
+        pool_size=seed_sequence.pool_size)
+
+
+def make_generator(seed_sequence, start=0):
+    """
+    Get a Generator over the random stream of a step of EM
+
+    hard_assign draws one number from the stream for each question, so a
+    Generator for the questions from start onwards is obtained by advancing
+    the stream by start draws. This lets shards of questions break their ties
+    independently, in any order and on any worker, while matching the
+    results of a single pass over all the questions.
+
+    Args:
+        seed_sequence: SeedSequence of the step (see step_seed_sequence)
+        start: Index of the first question to draw numbers for
+
+    Returns:
+        numpy Generator
+    """
+    bit_generator = np.random.PCG64(seed_sequence)
+    if start > 0:
+        bit_generator.advance(start)
+    return np.random.Generator(bit_generator)
 
 
 def calc_likelihood(counts, class_marginals, error_rates):
@@ -342,6 +738,10 @@ def calc_likelihood(counts, class_marginals, error_rates):
     This should go up monotonically as EM proceeds
     See equation 2.7 in Dawid-Skene (1979)
 
+    The computation is done in the log domain, so that questions with many
+    responses do not underflow. If the responses to a question have zero
+    probability under every class, the log-likelihood is -inf.
+
     Args:
         counts: Array of how many times each response was received
             by each question from each participant: [questions x participants x classes]
@@ -350,30 +750,29 @@ def calc_likelihood(counts, class_marginals, error_rates):
             label is j the label l: [observers x classes x classes]
 
     Returns:
-        Likelihood given current parameter estimates
+        Log-likelihood given current parameter estimates
     """
 
     [nPatients, nObservers, nClasses] = np.shape(counts)
+    with np.errstate(divide='ignore'):
+        log_class_marginals = np.log(class_marginals)
+        log_error_rates = np.log(error_rates)
     log_L = 0.0
 
     for i in range(nPatients):
-        patient_likelihood = 0.0
-        for j in range(nClasses):
-
-            class_prior = class_marginals[j]
-            patient_class_likelihood = np.prod(
-                np.power(error_rates[:, j, :], counts[i, :, :]))
-            patient_class_posterior = class_prior * patient_class_likelihood
-            patient_likelihood += patient_class_posterior
-
-        temp = log_L + np.log(patient_likelihood)
-
-        if np.isnan(temp) or np.isinf(temp):
-            if args.verbose:
-                print(i, log_L, np.log(patient_likelihood), temp)
-            sys.exit()
-
-        log_L = temp
+        # only the observed responses, so that zero error rates of responses
+        # that were not given do not contribute
+        (observers, responses) = np.nonzero(counts[i, :, :])
+        patient_log_posteriors = log_class_marginals + np.dot(
+            counts[i, observers, responses],
+            log_error_rates[observers, :, responses])
+
+        max_log_posterior = np.max(patient_log_posteriors)
+        if np.isneginf(max_log_posterior):
+            return -np.inf
+
+        log_L += max_log_posterior + np.log(
+            np.sum(np.exp(patient_log_posteriors - max_log_posterior)))
 
     return log_L
 
@@ -0,0 +1,110 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import print_function
+
+import argparse
+
+
+def main(argv=None):
+    """
+    Entry point of the fast-dawid-skene command
+
+    Args:
+        argv: Command line arguments. Default is sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description='Run the Dawid-Skene, Fast Dawid-Skene, the Hybrid, or the Majority Voting Algorithm')
+    parser.add_argument('--dataset', type=str, required=False,
+                        help='Name of the dataset to use. Datasets are found by name in the data directory of a source checkout, otherwise --dataset_path must also be given. Required unless --encoded_path or --shard_dir is set')
+    parser.add_argument('--k', default=0, type=int, required=False,
+                        help='Number of annotators to use. Each data point must have at least K annotators. If more annotators are available, the first K annotators are used. If K = 0, then all available annotations for each data point are used. Default is 0')
+    parser.add_argument('--algorithm', type=str, choices=['DS', 'FDS', 'H', 'MV'], required=True,
+                        help='Algorithm to use - DS: Dawid-Skene, FDS: Fast-Dawid Skene, H: Hybrid, MV: Majority Voting')
+    parser.add_argument('--mode', default='aggregate', type=str, choices=[
+                        'aggregate', 'test'], required=False, help='The mode to run this program - aggregate: obtain aggregated dataset, test: aggregate data and compare with ground truths. Default is aggregate')
+    parser.add_argument('--crowd_annotations_path', default=None, type=str, required=False,
+                        help='Path to crowdsourced annotations. Default is crowd.csv inside the dataset directory')
+    parser.add_argument('--ground_truths_path', default=None, type=str, required=False,
+                        help='Path to ground truths, if using test mode. Default is gold.csv inside the dataset directory')
+    parser.add_argument('--dataset_path', default=None, type=str,
+                        required=False, help='Custom path to dataset, to override default. Required if the package is installed rather than run from a source checkout')
+    parser.add_argument('--encoded_path', default=None, type=str, required=False,
+                        help='Path to pre-encoded annotations and ground truths in .npz format, to use instead of CSV files. Reading these does not require pandas')
+    parser.add_argument('--seed', default=18, type=int,
+                        required=False, help='Sets the random seed. Default is 18')
+    parser.add_argument('--output', default=None, type=str, required=False,
+                        help='Path to write CSV output, output is not written if this is not set')
+    parser.add_argument('--estimates_dir', default=None, type=str, required=False,
+                        help='Directory to write the estimates to, as .npy files that can be memory-mapped, along with an estimates.json manifest: the labels, the posterior probability of each class for each question, the class marginals, the confusion matrices of the annotators, and the question, annotator and annotation IDs. Estimates are not written if this is not set')
+    parser.add_argument('--backend', default='reference', type=str, choices=['reference', 'numpy', 'numba'], required=False,
+                        help='Implementation of the EM steps to use - reference: loops over the count array, numpy: vectorized kernels over sparse annotations, numba: compiled kernels over sparse annotations, which fall back to numpy if Numba is not installed. Default is reference, or numpy if using --shard_dir')
+    parser.add_argument('--smoothing', default=0.0, type=float, required=False,
+                        help='Non-negative pseudo-count added to each entry of the confusion matrices of the annotators in the M-step, for MAP rather than maximum likelihood estimates. This is the Dirichlet concentration minus 1. Default is 0')
+    parser.add_argument('--pool_threshold', default=0, type=int, required=False,
+                        help='Annotators with fewer annotations than this share a single pooled confusion matrix. Default is 0, for no pooling')
+    parser.add_argument('--shard_dir', default=None, type=str, required=False,
+                        help='Directory to write on-disk annotation shards to. If set, EM is run out-of-core, streaming over one shard of questions at a time, and the estimates of the true classes are written to posteriors.npy inside this directory. If neither --dataset nor --encoded_path is given, EM is run on the shards already written to this directory, without loading the dataset')
+    parser.add_argument('--shard_size', default=100000, type=int, required=False,
+                        help='Number of questions in each shard, if using --shard_dir. Default is 100000')
+    parser.add_argument('--chunk_size', default=1000000, type=int, required=False,
+                        help='Number of rows of the crowd annotations CSV file to read at a time when writing shards with --dataset and --shard_dir, so that the annotations are never all held in memory. Default is 1000000')
+    parser.add_argument('--executor', default='serial', type=str, choices=['serial', 'multiprocessing', 'socket'], required=False,
+                        help='How to run the map stage of each EM iteration over the shards, if using --shard_dir - serial: one shard after the other in this process, multiprocessing: over a pool of local processes, socket: over workers started with fast-dawid-skene-worker. Default is serial')
+    parser.add_argument('--processes', default=None, type=int, required=False,
+                        help='Number of processes for the multiprocessing executor (default is the number of CPUs), or number of workers to wait for with the socket executor')
+    parser.add_argument('--address', default='localhost:5018', type=str, required=False,
+                        help='host:port to listen on for workers with the socket executor. Default is localhost:5018')
+    parser.add_argument('--authkey', default=None, type=str, required=False,
+                        help='Authentication key shared with the workers of the socket executor. Anyone who can connect with the key can run code on the driver, so keep it secret. Default is a random key, which is printed for starting the workers')
+    parser.add_argument('--print_result', action='store_true',
+                        help='Prints the predictions and accuracy to standard output, if set')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Run in verbose mode', dest='verbose')
+    args = parser.parse_args(argv)
+    if args.dataset is None and args.encoded_path is None and args.shard_dir is None:
+        parser.error('one of the arguments --dataset --encoded_path --shard_dir is required')
+
+    # imported here so that --help and argument errors are fast
+    from .main import run
+
+    run(args)
+
+
+def worker(argv=None):
+    """
+    Entry point of the fast-dawid-skene-worker command
+
+    Args:
+        argv: Command line arguments. Default is sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description='Run a worker for the socket executor of the out-of-core Dawid-Skene, Fast Dawid-Skene, Hybrid, or Majority Voting Algorithm')
+    parser.add_argument('--address', default='localhost:5018', type=str, required=False,
+                        help='host:port the driver listens on. Default is localhost:5018')
+    parser.add_argument('--authkey', type=str, required=True,
+                        help='Authentication key shared with the driver, as given to or printed by the driver')
+    args = parser.parse_args(argv)
+
+    from .distributed import parse_address, serve
+
+    serve(parse_address(args.address), args.authkey.encode('utf-8'))
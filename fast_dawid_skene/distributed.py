@@ -0,0 +1,243 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import print_function
+
+import binascii
+import collections
+import multiprocessing
+import os
+import traceback
+from multiprocessing.connection import Client, Listener
+
+
+class SerialBackend(object):
+    """Backend to map tasks one after the other in this process"""
+
+    def map(self, function, tasks):
+        """
+        Maps a function over tasks
+
+        Args:
+            function: The function to apply to each task
+            tasks: Iterable of tasks
+
+        Returns:
+            An iterator over the results, in the order of the tasks
+        """
+        for task in tasks:
+            yield function(task)
+
+    def close(self):
+        """Releases the resources held by the backend"""
+        pass
+
+
+class MultiprocessingBackend(object):
+    """Backend to map tasks over a pool of local processes"""
+
+    def __init__(self, processes=None):
+        self.pool = multiprocessing.Pool(processes)
+
+    def map(self, function, tasks):
+        """
+        Maps a function over tasks
+
+        Args:
+            function: The function to apply to each task. Must be picklable
+            tasks: Iterable of tasks
+
+        Returns:
+            An iterator over the results, in the order of the tasks
+        """
+        return self.pool.imap(function, tasks)
+
+    def close(self):
+        """Releases the resources held by the backend"""
+        self.pool.close()
+        self.pool.join()
+
+
+class SocketBackend(object):
+    """
+    Backend to map tasks over workers connected through sockets
+
+    Workers are started with serve, on this or other nodes, and connect to the
+    address the backend listens on. Each worker is sent one task at a time,
+    and receives its next task once its result has been read. Tasks that refer
+    to files, such as shards, require the files to be accessible to all workers.
+
+    Tasks and results are pickled, so anyone who can connect with the
+    authentication key can run code on the backend and on the workers. The
+    key is generated at random unless one is given, and must be passed to
+    the workers.
+    """
+
+    def __init__(self, workers, address=('localhost', 0), authkey=None):
+        assert workers > 0, "Number of workers must be a positive integer"
+        if authkey is None:
+            authkey = generate_authkey()
+        self.workers = workers
+        self.authkey = authkey
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.connections = []
+
+    def connect(self):
+        """Waits for all workers to connect"""
+        while len(self.connections) < self.workers:
+            self.connections.append(self.listener.accept())
+
+    def map(self, function, tasks):
+        """
+        Maps a function over tasks
+
+        Args:
+            function: The function to apply to each task. Must be picklable
+            tasks: Iterable of tasks
+
+        Returns:
+            An iterator over the results, in the order of the tasks
+
+        Raises:
+            RuntimeError: If a task raised an exception on a worker
+        """
+        self.connect()
+        tasks = enumerate(tasks)
+        in_flight = collections.deque()
+
+        def dispatch(connection):
+            for index, task in tasks:
+                connection.send((function, task))
+                in_flight.append((index, connection))
+                return
+
+        for connection in self.connections:
+            dispatch(connection)
+
+        error = None
+        while in_flight:
+            index, connection = in_flight.popleft()
+            status, result = connection.recv()
+            if error is not None:
+                continue
+            if status == 'error':
+                # no more tasks are sent, and the results of those in flight
+                # are read, so that they are not taken for those of the next map
+                error = "Task " + str(index) + " failed on a worker:\n" + result
+                continue
+            dispatch(connection)
+            yield result
+
+        if error is not None:
+            raise RuntimeError(error)
+
+    def close(self):
+        """Stops the connected workers and releases the resources held by the backend"""
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        self.connections = []
+        self.listener.close()
+
+
+def serve(address, authkey):
+    """
+    Run a worker for a SocketBackend
+
+    Connects to the backend and runs the tasks it is sent until the backend
+    is closed.
+
+    Args:
+        address: (host, port) the backend listens on
+        authkey: Authentication key shared with the backend
+    """
+    connection = Client(tuple(address), authkey=authkey)
+    try:
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            function, task = message
+            try:
+                response = ('ok', function(task))
+            except Exception:
+                response = ('error', traceback.format_exc())
+            connection.send(response)
+    finally:
+        connection.close()
+
+
+def generate_authkey():
+    """
+    Generates a random authentication key for a SocketBackend
+
+    Returns:
+        The key, as hexadecimal digits: bytes
+    """
+    return binascii.hexlify(os.urandom(16))
+
+
+def parse_address(address):
+    """
+    Parses an address of the form host:port
+
+    Args:
+        address: The address string
+
+    Returns:
+        (host, port) tuple
+    """
+    host, port = address.rsplit(':', 1)
+    return (host, int(port))
+
+
+def create_backend(executor, processes=None, address=None, authkey=None):
+    """
+    Creates the backend to run the map stage of the EM iterations with
+
+    Args:
+        executor: One among ['serial', 'multiprocessing', 'socket']
+            'serial': map in this process
+            'multiprocessing': map over a pool of local processes
+            'socket': map over workers connected through sockets
+        processes: Number of processes in the pool for 'multiprocessing'
+            (all available CPUs if None), or number of workers to wait for
+            for 'socket'
+        address: host:port to listen on for 'socket'
+        authkey: Authentication key shared with the workers for 'socket'.
+            A random key is generated if None (see SocketBackend.authkey)
+
+    Returns:
+        The backend, or None for 'serial'
+    """
+    assert executor in ['serial', 'multiprocessing',
+                        'socket'], "Invalid executor specified!"
+    if executor == 'serial':
+        return None
+    if executor == 'multiprocessing':
+        return MultiprocessingBackend(processes)
+    assert processes is not None, "Number of workers must be specified for the socket executor"
+    return SocketBackend(processes, parse_address(address), authkey)
@@ -0,0 +1,132 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import numpy as np
+
+from . import utils
+
+
+def array_path(estimates_dir, name):
+    """
+    Gets the path of an array in an estimates directory
+
+    Args:
+        estimates_dir: Directory of the estimates
+        name: Name of the array, for instance 'posteriors'
+
+    Returns:
+        Path of the .npy file of the array
+    """
+    return os.path.join(estimates_dir, name + '.npy')
+
+
+def write_estimates(estimates_dir, result, posteriors, class_marginals,
+                    error_rates, question_dict=None, annotator_dict=None,
+                    annotation_dict=None, algorithm=None):
+    """
+    Write the estimates of a run as .npy files and a manifest
+
+    Each array is written to its own .npy file, so that consumers can
+    memory-map it and read slices without loading or parsing the rest (see
+    load_estimates). The manifest lists the arrays along with their shapes
+    and types. Posteriors that are already memory-mapped from their path in
+    the directory, as written by shards.run, are not copied.
+
+    Args:
+        estimates_dir: Directory to write the arrays and the manifest to
+        result: The estimated label for each question: [nQuestions]
+        posteriors: Posterior probability of each class for each
+            question: [questions x classes]
+        class_marginals: probability of a random question belonging to each
+            class: [classes]
+        error_rates: probability of participant k assigning a question whose
+            correct label is j the label l: [participants x classes x classes]
+        question_dict: Index to question dictionary, written as question_ids
+        annotator_dict: Index to annotator dictionary, written as
+            annotator_ids
+        annotation_dict: Index to annotation dictionary, written as
+            annotation_ids
+        algorithm: Name of the algorithm the estimates were obtained with
+    """
+    if not os.path.exists(estimates_dir):
+        os.makedirs(estimates_dir)
+
+    arrays = [('labels', result),
+              ('posteriors', posteriors),
+              ('class_marginals', class_marginals),
+              ('error_rates', error_rates),
+              ('question_ids', utils.vocabulary(question_dict)),
+              ('annotator_ids', utils.vocabulary(annotator_dict)),
+              ('annotation_ids', utils.vocabulary(annotation_dict))]
+
+    files = {}
+    for name, array in arrays:
+        if array is None:
+            continue
+        path = array_path(estimates_dir, name)
+        if not (isinstance(array, np.memmap) and array.filename is not None and
+                os.path.abspath(array.filename) == os.path.abspath(path)):
+            array = np.asarray(array)
+            # object arrays can not be memory-mapped
+            if array.dtype == object:
+                array = array.astype(str)
+            np.save(path, array)
+        files[name] = {'file': os.path.basename(path),
+                       'shape': list(array.shape),
+                       'dtype': array.dtype.str}
+
+    (nQuestions, nClasses) = np.shape(posteriors)
+    manifest = {'algorithm': algorithm, 'nQuestions': nQuestions,
+                'nParticipants': np.shape(error_rates)[0],
+                'nClasses': nClasses, 'arrays': files}
+    manifest_path = os.path.join(estimates_dir, utils.ESTIMATES_MANIFEST_NAME)
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def load_estimates(estimates_dir, mmap_mode='r'):
+    """
+    Load the estimates written by write_estimates
+
+    Args:
+        estimates_dir: Directory of the estimates
+        mmap_mode: Memory-map mode of the arrays (see numpy.load), or None to
+            read them into memory
+
+    Returns:
+        manifest: The manifest of the estimates
+        arrays: Dictionary from the name of each array to the array
+    """
+    manifest_path = os.path.join(estimates_dir, utils.ESTIMATES_MANIFEST_NAME)
+    assert os.path.exists(manifest_path), manifest_path + " does not exist!"
+
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    arrays = {}
+    for name, entry in manifest['arrays'].items():
+        arrays[name] = np.load(os.path.join(estimates_dir, entry['file']),
+                               mmap_mode=mmap_mode)
+    return manifest, arrays
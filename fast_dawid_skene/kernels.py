@@ -0,0 +1,293 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import print_function
+
+import math
+import warnings
+import numpy as np
+
+BACKENDS = ['numpy', 'numba']
+
+# Kernels over sparse annotations, which are arrays of rows of the form
+# (question, participant, class). The 'numpy' backend is vectorized, and the
+# 'numba' backend compiles the loops below in nopython mode, so that no
+# temporaries other than the outputs are allocated. Numba is slow to import,
+# so it is only imported, and the loops compiled, when first used.
+
+# compiled loops, by name
+_numba_kernels = {}
+
+
+def _import_numba():
+    """Imports Numba, returning None if it is not installed"""
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba
+
+
+def _numba_kernel(name):
+    """Gets the loop _<name>_loop compiled with Numba"""
+    if name not in _numba_kernels:
+        _numba_kernels[name] = _import_numba().njit(cache=True)(
+            globals()['_' + name + '_loop'])
+    return _numba_kernels[name]
+
+
+def resolve_backend(backend):
+    """
+    Gets the backend to run the kernels with
+
+    Args:
+        backend: One among ['numpy', 'numba']
+
+    Returns:
+        The backend, which is 'numpy' if 'numba' was requested but Numba is
+        not installed
+    """
+    assert backend in BACKENDS, "Invalid backend specified!"
+    if backend == 'numba' and _import_numba() is None:
+        warnings.warn("Numba is not installed, using the numpy backend")
+        return 'numpy'
+    return backend
+
+
+def response_sums(annotations, nQuestions, nClasses):
+    """
+    Count the number of times each question received each response
+
+    Args:
+        annotations: Annotations: [annotations x 3]
+        nQuestions: Number of questions
+        nClasses: Number of classes
+
+    Returns:
+        Counts of responses: [questions x classes]
+    """
+    annotations = np.asarray(annotations)
+    return np.bincount(
+        annotations[:, 0] * nClasses + annotations[:, 2],
+        minlength=nQuestions * nClasses).reshape(nQuestions, nClasses)
+
+
+def log_joint(annotations, nQuestions, class_marginals, error_rates,
+              backend='numpy'):
+    """
+    Compute the log joint probability of each class and the responses of each
+    question
+
+    This is the log of the estimate in equation 2.5 of Dawid-Skene (1979),
+    before normalization.
+
+    Args:
+        annotations: Annotations: [annotations x 3]
+        nQuestions: Number of questions
+        class_marginals: probability of a random question belonging to each class: [classes]
+        error_rates: probability of participant k assigning a question whose correct
+            label is j the label l: [participants x classes x classes]
+        backend: One among ['numpy', 'numba']
+
+    Returns:
+        log_joint: log of the class marginal times the probability of the
+            responses given the class: [questions x classes]
+    """
+    annotations = np.asarray(annotations)
+    nClasses = len(class_marginals)
+    with np.errstate(divide='ignore'):
+        log_class_marginals = np.log(class_marginals)
+        log_error_rates = np.log(error_rates)
+
+    result = np.empty([nQuestions, nClasses])
+    if resolve_backend(backend) == 'numba':
+        _numba_kernel('log_joint')(annotations, log_class_marginals,
+                                   log_error_rates, result)
+        return result
+
+    questions = annotations[:, 0]
+    participants = annotations[:, 1]
+    responses = annotations[:, 2]
+    for j in range(nClasses):
+        result[:, j] = log_class_marginals[j] + np.bincount(
+            questions, weights=log_error_rates[participants, j, responses],
+            minlength=nQuestions)
+
+    return result
+
+
+def posteriors(log_joint, backend='numpy'):
+    """
+    Normalize the joint probabilities into posteriors, and compute the
+    log-likelihood
+
+    See equations 2.5 and 2.7 in Dawid-Skene (1979). Questions whose responses
+    have zero probability under every class get all zero posteriors, and make
+    the log-likelihood -inf.
+
+    Args:
+        log_joint: Output of log_joint: [questions x classes]
+        backend: One among ['numpy', 'numba']
+
+    Returns:
+        question_classes: Posterior probability of each class for each
+            question: [questions x classes]
+        log_L: log-likelihood
+    """
+    if resolve_backend(backend) == 'numba':
+        question_classes = np.empty_like(log_joint)
+        log_L = _numba_kernel('posteriors')(log_joint, question_classes)
+        return question_classes, log_L
+
+    max_log_joint = np.max(log_joint, 1, keepdims=True)
+    shift = np.where(np.isfinite(max_log_joint), max_log_joint, 0.0)
+
+    with np.errstate(divide='ignore'):
+        joint = np.exp(log_joint - shift)
+        question_sums = np.sum(joint, 1, keepdims=True)
+        log_L = np.sum(np.log(question_sums) + shift)
+
+    question_classes = np.divide(joint, question_sums,
+                                 out=np.zeros_like(joint),
+                                 where=question_sums > 0)
+    return question_classes, log_L
+
+
+def accumulate(annotations, question_classes, nParticipants, backend='numpy'):
+    """
+    Accumulate the M-step sufficient statistics
+
+    Args:
+        annotations: Annotations: [annotations x 3]
+        question_classes: Current estimates of the true classes of the
+            questions: [questions x classes]
+        nParticipants: Number of participants
+        backend: One among ['numpy', 'numba']
+
+    Returns:
+        class_sums: Sum of the estimates over the questions: [classes]
+        error_counts: Expected number of times participant k labelled a question
+            of class j as l: [participants x classes x classes]
+    """
+    annotations = np.asarray(annotations)
+    nClasses = np.shape(question_classes)[1]
+
+    if resolve_backend(backend) == 'numba':
+        class_sums = np.zeros(nClasses)
+        error_counts = np.zeros([nParticipants, nClasses, nClasses])
+        _numba_kernel('accumulate')(annotations, question_classes,
+                                    class_sums, error_counts)
+        return class_sums, error_counts
+
+    questions = annotations[:, 0]
+    cells = annotations[:, 1] * nClasses + annotations[:, 2]
+
+    class_sums = np.sum(question_classes, 0)
+    error_counts = np.empty([nParticipants, nClasses, nClasses])
+    for j in range(nClasses):
+        error_counts[:, j, :] = np.bincount(
+            cells, weights=question_classes[questions, j],
+            minlength=nParticipants * nClasses).reshape(nParticipants, nClasses)
+
+    return class_sums, error_counts
+
+
+def normalize_statistics(class_sums, error_counts, nQuestions, smoothing=0.0):
+    """
+    Get the M-step estimates from accumulated sufficient statistics
+
+    See algorithms.m_step
+
+    Args:
+        class_sums: Sum of the estimates of the true classes over all
+            questions: [classes]
+        error_counts: Expected number of times participant k labelled a question
+            of class j as l: [participants x classes x classes]
+        nQuestions: Number of questions
+        smoothing: Non-negative pseudo-count added to each error count, for
+            MAP estimates under a symmetric Dirichlet prior with concentration
+            smoothing + 1 (see algorithms.m_step). 0 for MLE
+
+    Returns:
+        p_j: class marginals [classes]
+        pi_kjl: error rates [participants, classes, classes]
+    """
+    class_marginals = class_sums / float(nQuestions)
+    if smoothing > 0:
+        error_counts = error_counts + smoothing
+
+    sum_over_responses = np.sum(error_counts, 2, keepdims=True)
+    error_rates = np.divide(error_counts, sum_over_responses,
+                            out=np.zeros_like(error_counts),
+                            where=sum_over_responses > 0)
+
+    return (class_marginals, error_rates)
+
+
+def _log_joint_loop(annotations, log_class_marginals, log_error_rates, result):
+    nQuestions, nClasses = result.shape
+    for i in range(nQuestions):
+        for j in range(nClasses):
+            result[i, j] = log_class_marginals[j]
+    for a in range(annotations.shape[0]):
+        i = annotations[a, 0]
+        k = annotations[a, 1]
+        l = annotations[a, 2]
+        for j in range(nClasses):
+            result[i, j] += log_error_rates[k, j, l]
+
+
+def _posteriors_loop(log_joint, question_classes):
+    nQuestions, nClasses = log_joint.shape
+    log_L = 0.0
+    for i in range(nQuestions):
+        max_log_joint = log_joint[i, 0]
+        for j in range(1, nClasses):
+            if log_joint[i, j] > max_log_joint:
+                max_log_joint = log_joint[i, j]
+        if max_log_joint == -np.inf:
+            for j in range(nClasses):
+                question_classes[i, j] = 0.0
+            log_L = -np.inf
+            continue
+        question_sum = 0.0
+        for j in range(nClasses):
+            question_classes[i, j] = math.exp(log_joint[i, j] - max_log_joint)
+            question_sum += question_classes[i, j]
+        for j in range(nClasses):
+            question_classes[i, j] /= question_sum
+        log_L += max_log_joint + math.log(question_sum)
+    return log_L
+
+
+def _accumulate_loop(annotations, question_classes, class_sums, error_counts):
+    nQuestions, nClasses = question_classes.shape
+    for i in range(nQuestions):
+        for j in range(nClasses):
+            class_sums[j] += question_classes[i, j]
+    for a in range(annotations.shape[0]):
+        i = annotations[a, 0]
+        k = annotations[a, 1]
+        l = annotations[a, 2]
+        for j in range(nClasses):
+            error_counts[k, j, l] += question_classes[i, j]
+
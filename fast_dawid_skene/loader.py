@@ -23,36 +23,145 @@ SOFTWARE.
 from __future__ import print_function
 
 import numpy as np
-import pandas as pd
 import os
 import sys
-import config
 
+from . import utils
 
-class DataLoader:
-    """Class to load data for use in the algorithms"""
+# datasets are looked up by name in the data directory of a source checkout.
+# Installed packages have no data directory, and need the dataset path
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-    def __init__(self, dataset, k, mode='aggregate', data_dir=None,
-                 crowd_annotations_path=None, ground_truths_path=None):
-        self.dataset = dataset
+
+class BaseDataLoader:
+    """
+    Base class of the data loaders
+
+    Subclasses set the index to question, annotator and annotation
+    dictionaries and min_annotators, and implement filter_data.
+    """
+
+    def get_ind_to_question_dict(self):
+        """
+        Gets the index to question dictionary
+
+        Returns:
+            The index to question dictionary
+        """
+        return self.ind_to_question_dict
+
+    def get_ind_to_annotator_dict(self):
+        """
+        Gets the index to annotator dictionary
+
+        Returns:
+            The index to annotator dictionary
+        """
+        return self.ind_to_annotator_dict
+
+    def get_ind_to_annotation_dict(self):
+        """
+        Gets the index to annotation
+
+        Returns:
+            The index to annotation dictionary
+        """
+        return self.ind_to_annotation_dict
+
+    def set_k(self, k):
+        """
+        Sets the number of annotators to use
+
+        Args:
+            k: The number of annotators. 0 for using all available annotations
+
+        Raises:
+            AssertionError: If some questions have fewer than k annotations, or
+            if k < 0.
+        """
+        assert k >= 0 and k <= self.min_annotators, "Invalid value specified for k!"
         self.k = k
-        self.mode = mode
+        self.filter_data()
 
-        assert mode in ['aggregate', 'test'], "Invalid mode specified!"
+    def find_files(self, dataset, data_dir=None, crowd_annotations_path=None,
+                   ground_truths_path=None):
+        """
+        Finds the CSV files of a dataset
 
+        Sets data_path and crowd_path, and gt_path in 'test' mode
+
+        Args:
+            dataset: Name of the dataset, to find in the data directory of a
+                source checkout if no path is given
+            data_dir: Path of the dataset directory
+            crowd_annotations_path: Path of the crowdsourced annotations.
+                Default is crowd.csv inside the dataset directory
+            ground_truths_path: Path of the ground truths. Default is gold.csv
+                inside the dataset directory
+
+        Raises:
+            AssertionError: If a file does not exist
+        """
         if data_dir is not None:
             self.data_path = data_dir
         else:
             self.data_path = os.path.join(
-                config.root_dir, 'data', dataset + '_dataset')
+                root_dir, 'data', dataset + '_dataset')
         if crowd_annotations_path is not None:
             self.crowd_path = crowd_annotations_path
         else:
             self.crowd_path = os.path.join(self.data_path, 'crowd.csv')
-        assert self.k >= 0, "Number of annotators must be a positive integer, or 0 for allowing a variable number of annotators"
+        assert data_dir is not None or crowd_annotations_path is not None or os.path.exists(
+            self.data_path), self.data_path + " does not exist! Datasets can only be found by name in a source checkout, use --dataset_path to give the path of the dataset"
         assert os.path.exists(
             self.crowd_path), self.crowd_path + " does not exist!"
 
+        if self.mode == 'test':
+            if ground_truths_path is not None:
+                self.gt_path = ground_truths_path
+            else:
+                self.gt_path = os.path.join(self.data_path, 'gold.csv')
+            assert os.path.exists(
+                self.gt_path), self.gt_path + " does not exist!"
+
+    def get_annotation_chunks(self):
+        """
+        Gets the data as arrays of annotations, one chunk at a time
+
+        See get_annotations. All the annotations are given in a single chunk,
+        unless the loader reads them in chunks.
+
+        Yields:
+            Question, annotator and annotation index arrays of each chunk
+        """
+        yield self.get_annotations()[0]
+
+    def filter_data(self):
+        """
+        Selects the first k annotations for each question.
+        Selects all annotations if k = 0
+        """
+        raise NotImplementedError
+
+
+class DataLoader(BaseDataLoader):
+    """Class to load data for use in the algorithms"""
+
+    def __init__(self, dataset, k, mode='aggregate', data_dir=None,
+                 crowd_annotations_path=None, ground_truths_path=None):
+        # pandas is only needed to parse CSV files, and is slow to import
+        import pandas as pd
+
+        self.dataset = dataset
+        self.k = k
+        self.mode = mode
+
+        assert mode in ['aggregate', 'test'], "Invalid mode specified!"
+
+        assert self.k >= 0, "Number of annotators must be a positive integer, or 0 for allowing a variable number of annotators"
+        self.find_files(dataset, data_dir, crowd_annotations_path,
+                        ground_truths_path)
+
         self.crowd_df = pd.read_csv(self.crowd_path, names=[
             'Annotator', 'Question', 'Annotation'])
 
@@ -81,13 +190,6 @@ class DataLoader:
         self.filter_data()
 
         if self.mode == 'test':
-            if ground_truths_path is not None:
-                self.gt_path = ground_truths_path
-            else:
-                self.gt_path = os.path.join(self.data_path, 'gold.csv')
-            assert os.path.exists(
-                self.gt_path), self.gt_path + " does not exist!"
-
             self.gt_df = pd.read_csv(self.gt_path, names=[
                 'Question', 'Annotation'])
 
@@ -124,39 +226,6 @@ class DataLoader:
         val_to_ind_dict = {val: key for key, val in ind_to_val_dict.items()}
         return val_to_ind_dict, ind_to_val_dict
 
-    def get_ind_to_question_dict(self):
-        """
-        Gets the index to question dictionary
-
-        Returns:
-            The index to question dictionary
-        """
-        return self.ind_to_question_dict
-
-    def get_ind_to_annotation_dict(self):
-        """
-        Gets the index to annotation
-
-        Returns:
-            The index to annotation dictionary
-        """
-        return self.ind_to_annotation_dict
-
-    def set_k(self, k):
-        """
-        Sets the number of annotators to use
-
-        Args:
-            k: The number of annotators. 0 for using all available annotations
-
-        Raises:
-            AssertionError: If some questions have fewer than k annotations, or
-            if k < 0.
-        """
-        assert k >= 0 and k <= self.min_annotators, "Invalid value specified for k!"
-        self.k = k
-        self.filter_data()
-
     def filter_data(self):
         """
         Creates a filtered dataframe with first k annotations for each question.
@@ -196,11 +265,325 @@ class DataLoader:
                 data[question][annotator] = []
             data[question][annotator].append(annotation)
         self.data = data
+        return self.data, self.get_gold()
+
+    def get_annotations(self):
+        """
+        Gets the data as arrays of annotations and ground truths
+
+        Unlike get_data, this does not build a nested dictionary, and is used
+        to write the data to on-disk shards. Each annotation is described by
+        the index of its question, annotator and annotation. Ground truths are
+        structured as in get_data.
+
+        Returns:
+            Question, annotator and annotation index arrays, and ground truths
+            (None for ground truths in 'aggregate' mode)
+        """
+        questions = self.filtered_crowd_df['Question'].values
+        annotators = self.filtered_crowd_df['Annotator'].values
+        annotations = self.filtered_crowd_df['Annotation'].values
+        return (questions, annotators, annotations), self.get_gold()
+
+    def get_gold(self):
+        """
+        Gets the ground truths
+
+        Returns:
+            Ground truths, None in 'aggregate' mode
+        """
         if self.mode == 'test':
             self.gt = self.gt_df['Annotation'].values
         else:
             self.gt = None
-        return self.data, self.gt
+        return self.gt
+
+    def save_encoded(self, path):
+        """
+        Saves the encoded data, ground truths and vocabularies
+
+        The data is saved in the format read by EncodedDataLoader, so that
+        later runs can skip parsing the CSV files. All annotations are saved,
+        irrespective of k. Ground truths are saved ordered by question index.
+
+        Args:
+            path: Path of the .npz file to write
+        """
+        arrays = {
+            'questions': self.crowd_df['Question'].values,
+            'annotators': self.crowd_df['Annotator'].values,
+            'annotations': self.crowd_df['Annotation'].values,
+            'question_ids': utils.vocabulary(self.ind_to_question_dict),
+            'annotator_ids': utils.vocabulary(self.ind_to_annotator_dict),
+            'annotation_ids': utils.vocabulary(self.ind_to_annotation_dict)}
+        if self.mode == 'test':
+            gold = np.empty(self.num_questions, dtype=np.int64)
+            gold[self.gt_df['Question'].values] = self.gt_df[
+                'Annotation'].values
+            arrays['gold'] = gold
+        np.savez(path, **arrays)
+
+
+class EncodedDataLoader(BaseDataLoader):
+    """
+    Class to load pre-encoded data for use in the algorithms
+
+    The data is read from a .npz file with integer arrays 'questions',
+    'annotators' and 'annotations', giving the index of the question, annotator
+    and annotation of each crowdsourced annotation, in order. Optionally, it
+    may contain 'gold', the index of the ground truth annotation of each
+    question, and 'question_ids', 'annotator_ids' and 'annotation_ids', the
+    values that the indices stand for. Unlike DataLoader, this does not
+    require pandas.
+    """
+
+    def __init__(self, path, k, mode='aggregate'):
+        self.path = path
+        self.k = k
+        self.mode = mode
+
+        assert mode in ['aggregate', 'test'], "Invalid mode specified!"
+        assert self.k >= 0, "Number of annotators must be a positive integer, or 0 for allowing a variable number of annotators"
+        assert os.path.exists(self.path), self.path + " does not exist!"
+
+        with np.load(self.path) as encoded:
+            self.questions = encoded['questions'].astype(np.int64)
+            self.annotators = encoded['annotators'].astype(np.int64)
+            self.annotations = encoded['annotations'].astype(np.int64)
+            vocabularies = {}
+            for name in ['question_ids', 'annotator_ids', 'annotation_ids', 'gold']:
+                if name in encoded.files:
+                    vocabularies[name] = encoded[name]
+
+        self.num_questions = int(self.questions.max()) + 1
+        self.num_annotators = int(self.annotators.max()) + 1
+        self.num_options = int(self.annotations.max()) + 1
+
+        # position of each annotation among the annotations of its question
+        self.order = np.argsort(self.questions, kind='mergesort')
+        sorted_questions = self.questions[self.order]
+        self.ranks = np.empty(len(self.questions), dtype=np.int64)
+        self.ranks[self.order] = np.arange(len(self.questions)) - \
+            np.searchsorted(sorted_questions, sorted_questions)
+
+        question_counts = np.bincount(
+            self.questions, minlength=self.num_questions)
+        self.min_annotators = question_counts.min()
+        assert self.k <= self.min_annotators, "Some data points do not have " + \
+            str(self.k) + " annotators!"
+
+        self.ind_to_question_dict = _index_dict(
+            vocabularies.get('question_ids'), self.num_questions)
+        self.ind_to_annotator_dict = _index_dict(
+            vocabularies.get('annotator_ids'), self.num_annotators)
+        self.ind_to_annotation_dict = _index_dict(
+            vocabularies.get('annotation_ids'), self.num_options)
+
+        if self.mode == 'test':
+            assert 'gold' in vocabularies, self.path + " has no ground truths!"
+            self.gold = vocabularies['gold'].astype(np.int64)
+            assert len(self.gold) == self.num_questions, "Mismatch in number of questions in annotations and ground truths!"
+
+        self.filter_data()
+
+    def filter_data(self):
+        """
+        Selects the first k annotations for each question.
+        Selects all annotations if k = 0
+        """
+        if self.k > 0:
+            self.filtered = np.flatnonzero(self.ranks < self.k)
+        else:
+            self.filtered = np.arange(len(self.questions))
+
+    def get_data(self):
+        """
+        Gets the data and ground truths
+
+        See DataLoader.get_data
+
+        Returns:
+            Crowdsourced data and ground truths (None for ground truths in
+            'aggregate' mode)
+        """
+        data = {}
+        for index in self.filtered:
+            question = int(self.questions[index])
+            annotator = int(self.annotators[index])
+            if question not in data:
+                data[question] = {}
+            if annotator not in data[question]:
+                data[question][annotator] = []
+            data[question][annotator].append(int(self.annotations[index]))
+        self.data = data
+        return self.data, self.get_gold()
+
+    def get_annotations(self):
+        """
+        Gets the data as arrays of annotations and ground truths
+
+        See DataLoader.get_annotations
+
+        Returns:
+            Question, annotator and annotation index arrays, and ground truths
+            (None for ground truths in 'aggregate' mode)
+        """
+        return (self.questions[self.filtered], self.annotators[self.filtered],
+                self.annotations[self.filtered]), self.get_gold()
+
+    def get_gold(self):
+        """
+        Gets the ground truths
+
+        Returns:
+            Ground truths, None in 'aggregate' mode
+        """
+        if self.mode == 'test':
+            self.gt = self.gold
+        else:
+            self.gt = None
+        return self.gt
+
+
+class ChunkedDataLoader(BaseDataLoader):
+    """
+    Class to read crowdsourced annotations from CSV files in chunks
+
+    Unlike DataLoader, the annotations are never all held in memory. They are
+    read with pandas chunksize rows at a time, encoded with the indices of
+    the values seen so far, and given out chunk by chunk, for instance to
+    write them to on-disk shards with shards.ShardWriter. Values are indexed
+    in order of first appearance, as with DataLoader, so the indices are the
+    same. The dictionaries, the numbers of questions, annotators and options,
+    and the ground truths are only complete once all the chunks are read.
+    """
+
+    def __init__(self, dataset, k, mode='aggregate', data_dir=None,
+                 crowd_annotations_path=None, ground_truths_path=None,
+                 chunksize=1000000):
+        self.dataset = dataset
+        self.k = k
+        self.mode = mode
+        self.chunksize = chunksize
+
+        assert mode in ['aggregate', 'test'], "Invalid mode specified!"
+        assert self.k >= 0, "Number of annotators must be a positive integer, or 0 for allowing a variable number of annotators"
+        assert self.chunksize > 0, "Number of rows in each chunk must be a positive integer"
+        self.find_files(dataset, data_dir, crowd_annotations_path,
+                        ground_truths_path)
+
+        self.annotator_to_ind_dict, self.ind_to_annotator_dict = {}, {}
+        self.question_to_ind_dict, self.ind_to_question_dict = {}, {}
+        self.annotation_to_ind_dict, self.ind_to_annotation_dict = {}, {}
+
+    def get_annotation_chunks(self):
+        """
+        Gets the data as arrays of annotations, one chunk at a time
+
+        See DataLoader.get_annotations. Only the first k annotations of each
+        question are given, unless k = 0.
+
+        Yields:
+            Question, annotator and annotation index arrays of each chunk
+
+        Raises:
+            AssertionError: Once all the chunks are read, if some questions
+            have fewer than k annotations
+        """
+        # pandas is only needed to parse CSV files, and is slow to import
+        import pandas as pd
+
+        question_counts = np.zeros(0, dtype=np.int64)
+        for chunk in pd.read_csv(self.crowd_path, names=[
+                'Annotator', 'Question', 'Annotation'], chunksize=self.chunksize):
+            annotators = _encode_values(chunk['Annotator'],
+                                        self.annotator_to_ind_dict,
+                                        self.ind_to_annotator_dict)
+            questions = _encode_values(chunk['Question'],
+                                       self.question_to_ind_dict,
+                                       self.ind_to_question_dict)
+            annotations = _encode_values(chunk['Annotation'],
+                                         self.annotation_to_ind_dict,
+                                         self.ind_to_annotation_dict)
+
+            # position of each annotation among the annotations of its
+            # question, counting those of the chunks before
+            question_counts = np.concatenate([question_counts, np.zeros(
+                len(self.ind_to_question_dict) - len(question_counts),
+                dtype=np.int64)])
+            order = np.argsort(questions, kind='mergesort')
+            sorted_questions = questions[order]
+            ranks = np.empty(len(questions), dtype=np.int64)
+            ranks[order] = np.arange(len(questions)) - \
+                np.searchsorted(sorted_questions, sorted_questions)
+            ranks += question_counts[questions]
+            question_counts += np.bincount(
+                questions, minlength=len(question_counts))
+
+            if self.k > 0:
+                kept = ranks < self.k
+                yield questions[kept], annotators[kept], annotations[kept]
+            else:
+                yield questions, annotators, annotations
+
+        self.num_annotators = len(self.ind_to_annotator_dict)
+        self.num_questions = len(self.ind_to_question_dict)
+        self.num_options = len(self.ind_to_annotation_dict)
+        self.min_annotators = question_counts.min()
+        assert self.k <= self.min_annotators, "Some data points do not have " + \
+            str(self.k) + " annotators!"
+
+    def get_gold(self):
+        """
+        Gets the ground truths
+
+        The ground truths are read once all the chunks are read, and are
+        ordered by question index.
+
+        Returns:
+            Ground truths, None in 'aggregate' mode
+        """
+        if self.mode != 'test':
+            self.gt = None
+            return self.gt
+
+        import pandas as pd
+
+        gt_df = pd.read_csv(self.gt_path, names=['Question', 'Annotation'])
+        assert gt_df['Question'].nunique() == self.num_questions, "Mismatch in number of questions in annotations and ground truths!"
+        questions = gt_df['Question'].map(self.question_to_ind_dict)
+        assert ~questions.isnull().values.any(
+        ), "Mismatch in question IDs in annotations and ground truths!"
+        annotations = gt_df['Annotation'].map(self.annotation_to_ind_dict)
+        assert ~annotations.isnull().values.any(
+        ), "Mismatch in annotation IDs in annotations and ground truths! Possible causes: a ground truth label does not appear anywhere in the crowd annotations."
+
+        self.gt = np.empty(self.num_questions, dtype=np.int64)
+        self.gt[questions.values.astype(np.int64)] = annotations.values
+        return self.gt
+
+    def filter_data(self):
+        """
+        Does nothing, as the first k annotations for each question are
+        selected while the chunks are read
+        """
+
+
+def _encode_values(values, val_to_ind_dict, ind_to_val_dict):
+    """Encodes a column of values as indices, adding new values to the dictionaries"""
+    for val in values.unique():
+        if val not in val_to_ind_dict:
+            ind = len(ind_to_val_dict)
+            val_to_ind_dict[val] = ind
+            ind_to_val_dict[ind] = val
+    return values.map(val_to_ind_dict).values.astype(np.int64)
+
+
+def _index_dict(vocabulary, size):
+    """Converts an array of values into an index to value dictionary"""
+    if vocabulary is None:
+        return dict((ind, ind) for ind in range(size))
+    return dict(enumerate(vocabulary.tolist()))
 
 if __name__ == "__main__":
     print("Data Loader")
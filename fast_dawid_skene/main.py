@@ -22,39 +22,190 @@ SOFTWARE.
 
 from __future__ import print_function
 
-import argparse
+import functools
 import os
-import loader
-import algorithms
-import utils
-import pandas as pd
+import sys
+import numpy as np
 
+from . import algorithms, estimates, loader, utils
+
+# name of the file holding the IDs of the questions, annotators and
+# annotations, written next to the shards
+VOCABULARIES_NAME = 'vocabularies.npz'
 
-def run(args):
-    l = loader.DataLoader(args.dataset, args.k, args.mode, args.dataset_path,
-                          args.crowd_annotations_path, args.ground_truths_path)
-    data, gt = l.get_data()
-    result, accuracy = algorithms.main(args, data, gt)
 
-    ind_to_question_dict = l.get_ind_to_question_dict()
-    ind_to_annotation_dict = l.get_ind_to_annotation_dict()
+def run(args):
+    if args.encoded_path is not None:
+        l = loader.EncodedDataLoader(args.encoded_path, args.k, args.mode)
+    elif args.dataset is not None and args.shard_dir is not None:
+        # the CSV file is streamed to the shards, without loading it all
+        l = loader.ChunkedDataLoader(
+            args.dataset, args.k, args.mode, args.dataset_path,
+            args.crowd_annotations_path, args.ground_truths_path,
+            args.chunk_size)
+    elif args.dataset is not None:
+        l = loader.DataLoader(args.dataset, args.k, args.mode, args.dataset_path,
+                              args.crowd_annotations_path, args.ground_truths_path)
+    else:
+        # run on the shards already in the shard directory
+        l = None
+    return_estimates = args.estimates_dir is not None
+    if args.shard_dir is not None:
+        from . import distributed, shards
 
-    result_annotations = pd.DataFrame(data=result, columns=['Annotation'])
-    result_annotations.reset_index(level=0, inplace=True)
-    result_annotations = result_annotations.rename(
-        columns={'index': 'Question'})
+        if l is None:
+            assert args.mode == 'aggregate', "Ground truths are not stored with the shards, test mode requires a dataset!"
+            assert args.k == 0, "The number of annotators can not be changed for existing shards!"
+            store = shards.ShardStore(args.shard_dir)
+            gt = None
+            vocabularies = _load_vocabularies(args.shard_dir)
+        else:
+            writer = shards.ShardWriter(args.shard_dir, args.shard_size)
+            for chunk in l.get_annotation_chunks():
+                writer.append(*chunk)
+            store = writer.close(l.num_questions, l.num_annotators,
+                                 l.num_options)
+            gt = l.get_gold()
+            vocabularies = (l.get_ind_to_question_dict(),
+                            l.get_ind_to_annotator_dict(),
+                            l.get_ind_to_annotation_dict())
+            _save_vocabularies(args.shard_dir, vocabularies)
+        # the posteriors are written by the map stage directly to the
+        # estimates directory
+        posteriors_path = None
+        if return_estimates:
+            if not os.path.exists(args.estimates_dir):
+                os.makedirs(args.estimates_dir)
+            posteriors_path = estimates.array_path(
+                args.estimates_dir, 'posteriors')
+        authkey = None
+        if args.authkey is not None:
+            authkey = args.authkey.encode('utf-8')
+        executor = distributed.create_backend(
+            args.executor, args.processes, args.address, authkey)
+        if args.executor == 'socket' and authkey is None:
+            print("Start the workers with --authkey",
+                  executor.authkey.decode('ascii'))
+            sys.stdout.flush()
+        try:
+            outputs = algorithms.main(
+                args, store, gt, return_estimates, functools.partial(
+                    shards.run, posteriors_path=posteriors_path,
+                    executor=executor))
+        finally:
+            if executor is not None:
+                executor.close()
+    else:
+        assert args.executor == 'serial', "A shard directory must be specified to use the " + \
+            args.executor + " executor!"
+        data, gt = l.get_data()
+        # the accuracy is computed once the labels are indexed like the loader
+        outputs = _align_outputs(
+            data, algorithms.main(args, data, None, return_estimates), gt,
+            l.num_annotators, l.num_options)
+        vocabularies = (l.get_ind_to_question_dict(),
+                        l.get_ind_to_annotator_dict(),
+                        l.get_ind_to_annotation_dict())
+    result, accuracy = outputs[:2]
 
-    result_annotations['Question'] = result_annotations[
-        'Question'].map(ind_to_question_dict)
-    result_annotations['Annotation'] = result_annotations[
-        'Annotation'].map(ind_to_annotation_dict)
+    (ind_to_question_dict, ind_to_annotator_dict,
+     ind_to_annotation_dict) = vocabularies
 
     if args.print_result:
         print("Predictions:")
-        print(result_annotations)
+        utils.print_predictions(result, ind_to_question_dict,
+                                ind_to_annotation_dict)
         if args.mode == 'test':
             print("Accuracy:")
             print(accuracy)
     if args.output is not None:
         utils.to_csv(result, args.output,
                      ind_to_question_dict, ind_to_annotation_dict)
+    if return_estimates:
+        (posteriors, class_marginals, error_rates) = outputs[2]
+        estimates.write_estimates(
+            args.estimates_dir, result, posteriors, class_marginals,
+            error_rates, ind_to_question_dict, ind_to_annotator_dict,
+            ind_to_annotation_dict, args.algorithm)
+
+
+def _save_vocabularies(shard_dir, vocabularies):
+    """
+    Save the IDs of the questions, annotators and annotations with the shards
+
+    Args:
+        shard_dir: Directory of the shards
+        vocabularies: Index to question, annotator and annotation dictionaries
+    """
+    arrays = {}
+    for name, ind_to_val_dict in zip(
+            ['question_ids', 'annotator_ids', 'annotation_ids'], vocabularies):
+        array = utils.vocabulary(ind_to_val_dict)
+        # object arrays can not be loaded without pickle
+        if array.dtype == object:
+            array = array.astype(str)
+        arrays[name] = array
+    np.savez(os.path.join(shard_dir, VOCABULARIES_NAME), **arrays)
+
+
+def _load_vocabularies(shard_dir):
+    """
+    Load the IDs saved with the shards
+
+    Args:
+        shard_dir: Directory of the shards
+
+    Returns:
+        Index to question, annotator and annotation dictionaries. Each is None
+        if the IDs were not saved, for shards written with shards.write_shards
+    """
+    path = os.path.join(shard_dir, VOCABULARIES_NAME)
+    if not os.path.exists(path):
+        return (None, None, None)
+    with np.load(path) as arrays:
+        return tuple(dict(enumerate(arrays[name].tolist())) for name in
+                     ['question_ids', 'annotator_ids', 'annotation_ids'])
+
+
+def _align_outputs(data, outputs, gold, nParticipants, nClasses):
+    """
+    Index the outputs of algorithms.main like the data loader
+
+    algorithms.run only estimates labels, posteriors and error rates for the
+    participants and classes present in the data, which may be a subset of
+    those of the loader when only k annotators are used. The labels are
+    mapped to the class indices of the loader, and the estimates are placed
+    at the indices of the loader, with zeros elsewhere.
+
+    Args:
+        data: The data the outputs were obtained from:
+            {questions: {participants: [labels]}}
+        outputs: Outputs of algorithms.main, without gold
+        gold: The correct label for each question: [nQuestions]
+        nParticipants: Number of annotators of the loader
+        nClasses: Number of options of the loader
+
+    Returns:
+        Outputs of algorithms.main with gold, indexed like the loader
+    """
+    participants = sorted(set(k for i in data for k in data[i]))
+    classes = sorted(set(
+        l for i in data for k in data[i] for l in data[i][k]))
+
+    result = np.asarray(classes)[outputs[0]]
+    if gold is not None:
+        acc = (gold == result).mean()
+    else:
+        acc = None
+    if len(outputs) == 2:
+        return result, acc
+
+    (posteriors, class_marginals, error_rates) = outputs[2]
+    aligned_posteriors = np.zeros([len(posteriors), nClasses])
+    aligned_posteriors[:, classes] = posteriors
+    aligned_class_marginals = np.zeros(nClasses)
+    aligned_class_marginals[classes] = class_marginals
+    aligned_error_rates = np.zeros([nParticipants, nClasses, nClasses])
+    aligned_error_rates[np.ix_(participants, classes, classes)] = error_rates
+    return result, acc, (aligned_posteriors, aligned_class_marginals,
+                         aligned_error_rates)
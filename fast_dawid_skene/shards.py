@@ -0,0 +1,455 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import numpy as np
+
+from . import algorithms, kernels, utils
+
+
+class ShardStore(object):
+    """
+    Class to read annotations stored as on-disk shards
+
+    Each shard holds the annotations of a contiguous range of questions as an
+    integer array of rows (question offset within the shard, participant,
+    class), and is memory-mapped when read, so only the shard being processed
+    needs to be resident in memory.
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        manifest_path = os.path.join(shard_dir, utils.SHARDS_MANIFEST_NAME)
+        assert os.path.exists(manifest_path), manifest_path + " does not exist!"
+
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.nQuestions = manifest['nQuestions']
+        self.nParticipants = manifest['nParticipants']
+        self.nClasses = manifest['nClasses']
+        self.shards = manifest['shards']
+
+    def __len__(self):
+        return len(self.shards)
+
+    def get_shard(self, index):
+        """
+        Gets a shard
+
+        Args:
+            index: Index of the shard
+
+        Returns:
+            start: Index of the first question in the shard
+            stop: One past the index of the last question in the shard
+            annotations: Memory-mapped annotations of the shard:
+                [annotations x 3]
+        """
+        shard = self.shards[index]
+        annotations = np.load(os.path.join(self.shard_dir, shard['file']),
+                              mmap_mode='r')
+        return shard['start'], shard['stop'], annotations
+
+    def __iter__(self):
+        for index in range(len(self.shards)):
+            yield self.get_shard(index)
+
+
+class ShardWriter(object):
+    """
+    Class to write annotations to on-disk shards incrementally
+
+    Annotations are appended in chunks, whose questions may be in any order.
+    Each chunk is split by question range, and the annotations of each range
+    are appended to a partial file of its shard, so that only one chunk needs
+    to be held in memory. On close, each shard is sorted by question, one
+    shard at a time, and saved along with the manifest. For the same
+    annotations in the same order, the shards are the same however they are
+    split into chunks.
+    """
+
+    def __init__(self, shard_dir, questions_per_shard=100000):
+        assert questions_per_shard > 0, "Number of questions per shard must be a positive integer"
+        self.shard_dir = shard_dir
+        self.questions_per_shard = questions_per_shard
+        self.nQuestions = 0
+        self.nParticipants = 0
+        self.nClasses = 0
+        # shards with a partial file written by this writer
+        self.partial = set()
+
+        if not os.path.exists(shard_dir):
+            os.makedirs(shard_dir)
+
+    def append(self, questions, participants, classes):
+        """
+        Appends a chunk of annotations to the shards
+
+        Args:
+            questions: Question index of each annotation: [annotations]
+            participants: Participant index of each annotation: [annotations]
+            classes: Class index of each annotation: [annotations]
+        """
+        questions = np.asarray(questions, dtype=np.int64)
+        participants = np.asarray(participants, dtype=np.int64)
+        classes = np.asarray(classes, dtype=np.int64)
+        assert len(questions) == len(participants) == len(classes), "Mismatch in number of questions, participants and classes!"
+        if len(questions) == 0:
+            return
+
+        self.nQuestions = max(self.nQuestions, int(questions.max()) + 1)
+        self.nParticipants = max(self.nParticipants,
+                                 int(participants.max()) + 1)
+        self.nClasses = max(self.nClasses, int(classes.max()) + 1)
+
+        # a stable sort keeps the annotations of each shard in input order
+        indices = questions // self.questions_per_shard
+        order = np.argsort(indices, kind='mergesort')
+        sorted_indices = indices[order]
+        bounds = np.flatnonzero(np.diff(sorted_indices)) + 1
+        for rows in np.split(order, bounds):
+            index = int(indices[rows[0]])
+            annotations = np.column_stack(
+                [questions[rows] - index * self.questions_per_shard,
+                 participants[rows], classes[rows]])
+            # partial files left by another writer are overwritten
+            file_mode = 'ab' if index in self.partial else 'wb'
+            with open(self._partial_path(index), file_mode) as partial_file:
+                annotations.tofile(partial_file)
+            self.partial.add(index)
+
+    def close(self, nQuestions=None, nParticipants=None, nClasses=None):
+        """
+        Saves the shards and the manifest
+
+        Args:
+            nQuestions: Number of questions. Inferred from the questions if
+                None
+            nParticipants: Number of participants. Inferred from the
+                participants if None
+            nClasses: Number of classes. Inferred from the classes if None
+
+        Returns:
+            A ShardStore over the written shards
+        """
+        if nQuestions is None:
+            nQuestions = self.nQuestions
+        if nParticipants is None:
+            nParticipants = self.nParticipants
+        if nClasses is None:
+            nClasses = self.nClasses
+        assert self.nQuestions <= nQuestions, "Annotations of more than " + \
+            str(nQuestions) + " questions were written!"
+
+        shards = []
+        for start in range(0, nQuestions, self.questions_per_shard):
+            stop = min(start + self.questions_per_shard, nQuestions)
+            index = len(shards)
+            if index in self.partial:
+                partial_path = self._partial_path(index)
+                annotations = np.fromfile(
+                    partial_path, dtype=np.int64).reshape(-1, 3)
+                os.remove(partial_path)
+                # a stable sort keeps the annotations of each question in
+                # input order
+                annotations = annotations[np.argsort(
+                    annotations[:, 0], kind='mergesort')]
+            else:
+                annotations = np.zeros([0, 3], dtype=np.int64)
+            file_name = 'shard_%05d.npy' % index
+            np.save(os.path.join(self.shard_dir, file_name), annotations)
+            shards.append({'file': file_name, 'start': start, 'stop': stop})
+        self.partial = set()
+
+        manifest = {'nQuestions': nQuestions, 'nParticipants': nParticipants,
+                    'nClasses': nClasses, 'shards': shards}
+        with open(os.path.join(self.shard_dir, utils.SHARDS_MANIFEST_NAME), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+        return ShardStore(self.shard_dir)
+
+    def _partial_path(self, index):
+        """Gets the path of the partial file of a shard"""
+        return os.path.join(self.shard_dir, 'shard_%05d.part' % index)
+
+
+def write_shards(questions, participants, classes, shard_dir,
+                 questions_per_shard=100000, nQuestions=None,
+                 nParticipants=None, nClasses=None):
+    """
+    Write annotations to on-disk shards partitioned by question
+
+    All the annotations are given at once. Use ShardWriter to write them in
+    chunks instead.
+
+    Args:
+        questions: Question index of each annotation: [annotations]
+        participants: Participant index of each annotation: [annotations]
+        classes: Class index of each annotation: [annotations]
+        shard_dir: Directory to write the shards and the manifest to
+        questions_per_shard: Number of questions in each shard
+        nQuestions: Number of questions. Inferred from questions if None
+        nParticipants: Number of participants. Inferred from participants
+            if None
+        nClasses: Number of classes. Inferred from classes if None
+
+    Returns:
+        A ShardStore over the written shards
+    """
+    writer = ShardWriter(shard_dir, questions_per_shard)
+    writer.append(questions, participants, classes)
+    return writer.close(nQuestions, nParticipants, nClasses)
+
+
+def run(store, args, tol=0.0001, CM_tol=0.005, max_iter=100,
+        posteriors_path=None, executor=None, rng=None, return_estimates=False):
+    """
+    Run the aggregator out-of-core on sharded response data
+
+    Equivalent to algorithms.run, with the same EM driver (see algorithms.em),
+    but each iteration is a map over the shards, which writes the E-step
+    estimates to a memory-mapped posterior file and accumulates the sufficient
+    statistics of the next M-step, followed by a reduce that sums the
+    statistics. Only one shard and the parameters are held in memory at a time
+    by each worker.
+
+    Args:
+        store: ShardStore over the responses
+        args: Must contain algorithm whose value should be
+            one among ['FDS','DS','H','MV']
+            And should contain verbose whose value should be either True or False
+            May contain backend whose value should be one among
+            ['reference', 'numpy', 'numba'] to select the kernels. Shards are
+            always sparse, so 'reference' uses the numpy kernels
+            May contain smoothing and pool_threshold (see algorithms.run)
+        tol: threshold for class marginals for convergence of the algorithm
+        CM_tol: threshold for class marginals for switching to 'hard' mode
+            in Hybrid algorithm. Has no effect for FDS or DS
+        max_iter: maximum number of iterations of EM
+        posteriors_path: Path of the .npy file to hold the estimates of the
+            true classes. Default is posteriors.npy inside the shard directory
+        executor: Backend to run the map stage with (see distributed). If None,
+            shards are mapped one after the other in this process
+        rng: numpy Generator, SeedSequence or integer seed to break ties with
+            (see algorithms.run). Each shard draws from its own part of the
+            random stream of each step (see algorithms.make_generator), so
+            results do not depend on the executor or on the order in which
+            shards are processed, and match those of algorithms.run
+        return_estimates: whether to also return the fitted parameters and
+            the posteriors computed from them
+
+    Returns:
+        The estimated label for each question: [nQuestions]
+        If return_estimates is set, also
+            question_classes: posterior probability of each class for each
+                question, even for the algorithms that make hard
+                assignments, memory-mapped from posteriors_path:
+                [questions x classes]
+            p_j: class marginals [classes]
+            pi_kjl: error rates [participants, classes, classes]. Pooled
+                participants share the same rows
+            For 'MV', the parameters are estimated from the majority votes
+    """
+
+    backend = getattr(args, 'backend', 'reference')
+    if backend == 'reference':
+        backend = 'numpy'
+    smoothing = getattr(args, 'smoothing', 0.0)
+    pool_threshold = getattr(args, 'pool_threshold', 0)
+    assert smoothing >= 0, "Smoothing must be a non-negative pseudo-count!"
+    if rng is None:
+        rng = getattr(args, 'seed', None)
+    seed_sequence = algorithms.make_seed_sequence(rng)
+
+    participant_counts = np.zeros(store.nParticipants, dtype=np.int64)
+    if pool_threshold > 0:
+        for _, _, annotations in store:
+            participant_counts += np.bincount(
+                annotations[:, 1], minlength=store.nParticipants)
+    groups = algorithms.pool_participants(participant_counts, pool_threshold)
+    nGroups = int(np.max(groups)) + 1
+    if nGroups == store.nParticipants:
+        groups = None
+
+    if posteriors_path is None:
+        posteriors_path = os.path.join(store.shard_dir, 'posteriors.npy')
+    posteriors = np.lib.format.open_memmap(
+        posteriors_path, mode='w+', dtype=np.float64,
+        shape=(store.nQuestions, store.nClasses))
+    del posteriors
+
+    if args.verbose:
+        print("Number of Questions:", store.nQuestions)
+        print("Number of Participants:", store.nParticipants)
+        if groups is not None:
+            print("Number of Confusion Matrices:", nGroups)
+        print("Number of Classes:", store.nClasses)
+        print("Number of Shards:", len(store))
+
+    def map_reduce(step, mode, params=None):
+        (class_marginals, error_rates) = params or (None, None)
+        seed = algorithms.step_seed_sequence(seed_sequence, step)
+        tasks = []
+        for shard in store.shards:
+            tasks.append({'shard_dir': store.shard_dir, 'file': shard['file'],
+                          'start': shard['start'], 'stop': shard['stop'],
+                          'nClasses': store.nClasses,
+                          'posteriors_path': posteriors_path, 'mode': mode,
+                          'class_marginals': class_marginals,
+                          'error_rates': error_rates, 'seed': seed,
+                          'backend': backend, 'groups': groups,
+                          'nGroups': nGroups})
+        if executor is None:
+            partials = (map_shard(task) for task in tasks)
+        else:
+            partials = executor.map(map_shard, tasks)
+        (class_sums, error_counts, log_L) = reduce_statistics(
+            partials, nGroups, store.nClasses)
+        return (class_sums, error_counts), log_L
+
+    def initialize(mode):
+        return map_reduce(0, mode)[0]
+
+    def m_step(statistics):
+        (class_sums, error_counts) = statistics
+        return kernels.normalize_statistics(
+            class_sums, error_counts, store.nQuestions, smoothing)
+
+    (_, class_marginals, error_rates, nIter, _) = algorithms.em(
+        initialize, map_reduce, m_step, args, tol, CM_tol, max_iter,
+        return_estimates)
+
+    result = _argmax_posteriors(store, posteriors_path)
+    if not return_estimates:
+        return result
+
+    # posteriors from the parameters, even for the algorithms that make hard
+    # assignments, in place of the estimates of the last step
+    map_reduce(nIter + 1, 'DS', (class_marginals, error_rates))
+    if groups is not None:
+        error_rates = error_rates[groups]
+    return (result, np.load(posteriors_path, mmap_mode='r'), class_marginals,
+            error_rates)
+
+
+def map_shard(task):
+    """
+    Map stage of an EM iteration over one shard
+
+    Initializes the estimates of the true classes of the questions in the
+    shard if no error rates are given, or performs the E (+ C) step otherwise.
+    The estimates are written to the posterior file, and the sufficient
+    statistics for the next M-step are returned.
+
+    Args:
+        task: A dictionary with keys
+            shard_dir: Directory of the ShardStore
+            file: File of the shard, within shard_dir
+            start: Index of the first question in the shard
+            stop: One past the index of the last question in the shard
+            nClasses: Number of classes
+            posteriors_path: Path of the .npy file holding the estimates
+            mode: One among ['H', 'Hphase2', 'FDS', 'DS', 'MV']
+            class_marginals: Current class marginals, or None
+            error_rates: Current error rates, or None to initialize
+            seed: SeedSequence of the step, used to break ties (see
+                algorithms.make_generator)
+            backend: Kernels to use, one among ['numpy', 'numba']
+            groups: Index of the confusion matrix of each participant (see
+                algorithms.pool_participants), or None if not pooled
+            nGroups: Number of confusion matrices
+
+    Returns:
+        class_sums: Sum of the estimates over the questions: [classes]
+        error_counts: Expected number of times participant k labelled a question
+            of class j as l: [confusion matrices x classes x classes]
+        log_L: Contribution of the shard to the log-likelihood, 0 when
+            initializing
+    """
+    # the shard is described by the task, so that the manifest is not read
+    # for every shard of every iteration
+    start, stop = task['start'], task['stop']
+    annotations = np.load(os.path.join(task['shard_dir'], task['file']),
+                          mmap_mode='r')
+    if task['groups'] is not None:
+        annotations = np.array(annotations)
+        annotations[:, 1] = task['groups'][annotations[:, 1]]
+    rng = algorithms.make_generator(task['seed'], start)
+
+    if task['error_rates'] is None:
+        question_classes = algorithms.initialize_sums(
+            kernels.response_sums(annotations, stop - start, task['nClasses']),
+            task['mode'], rng)
+        log_L = 0.0
+    else:
+        question_classes, log_L = algorithms.e_step_sparse(
+            annotations, task['class_marginals'], task['error_rates'],
+            task['mode'], stop - start, rng, task['backend'])
+
+    posteriors = np.load(task['posteriors_path'], mmap_mode='r+')
+    posteriors[start:stop] = question_classes
+    posteriors.flush()
+    del posteriors
+
+    class_sums, error_counts = kernels.accumulate(
+        annotations, question_classes, task['nGroups'], task['backend'])
+    return class_sums, error_counts, log_L
+
+
+def reduce_statistics(partials, nParticipants, nClasses):
+    """
+    Reduce stage of an EM iteration
+
+    Args:
+        partials: Iterable of outputs of map_shard
+        nParticipants: Number of participants, or of confusion matrices if
+            participants are pooled
+        nClasses: Number of classes
+
+    Returns:
+        class_sums: Sum of the estimates over all questions: [classes]
+        error_counts: Expected number of times participant k labelled a question
+            of class j as l: [participants x classes x classes]
+        log_L: log-likelihood
+    """
+    class_sums = np.zeros(nClasses)
+    error_counts = np.zeros([nParticipants, nClasses, nClasses])
+    log_L = 0.0
+    for shard_sums, shard_counts, shard_log_L in partials:
+        class_sums += shard_sums
+        error_counts += shard_counts
+        log_L += shard_log_L
+
+    return class_sums, error_counts, log_L
+
+
+def _argmax_posteriors(store, posteriors_path):
+    """Take the most likely class of each question, one shard at a time"""
+    posteriors = np.load(posteriors_path, mmap_mode='r')
+    result = np.empty(store.nQuestions, dtype=np.int64)
+    for shard in store.shards:
+        start, stop = shard['start'], shard['stop']
+        result[start:stop] = np.argmax(posteriors[start:stop], axis=1)
+    return result
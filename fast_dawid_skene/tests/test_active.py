@@ -0,0 +1,116 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import numpy as np
+import pytest
+from fast_dawid_skene import active, algorithms
+from fast_dawid_skene.tests.helpers import to_responses
+
+
+def brute_force_reduction(question_classes, error_rates):
+    [nQuestions, nClasses] = np.shape(question_classes)
+    nParticipants = np.shape(error_rates)[0]
+    reductions = np.zeros([nQuestions, nParticipants])
+    for i in range(nQuestions):
+        for k in range(nParticipants):
+            expected_error = 0.0
+            for l in range(nClasses):
+                joint = question_classes[i, :] * error_rates[k, :, l]
+                if joint.sum() > 0:
+                    expected_error += joint.sum() * \
+                        (1 - np.max(joint / joint.sum()))
+            reductions[i, k] = (1 - np.max(question_classes[i, :])) - \
+                expected_error
+    return reductions
+
+
+@pytest.fixture()
+def estimates(annotations):
+    responses = to_responses(*annotations)
+    args = argparse.Namespace(algorithm='DS', verbose=False, backend='numpy')
+    (_, question_classes, _, error_rates) = algorithms.run(
+        responses, args, return_estimates=True)
+    sparse = algorithms.responses_to_annotations(responses)[3]
+    return question_classes, error_rates, sparse
+
+
+class TestActive(object):
+
+    def test_entropy(self):
+        question_classes = np.array([[1, 0], [0.5, 0.5], [0.25, 0.75]])
+        assert np.allclose(active.entropy(question_classes), [
+                           0, np.log(2), -(0.25 * np.log(0.25) + 0.75 * np.log(0.75))])
+
+    def test_margin(self):
+        question_classes = np.array([[1, 0, 0], [0.5, 0.2, 0.3],
+                                     [0.4, 0.4, 0.2]])
+        assert np.allclose(active.margin(question_classes), [1, 0.2, 0])
+
+    def test_expected_error_reduction(self, estimates):
+        question_classes, error_rates, _ = estimates
+        reductions = active.expected_error_reduction(
+            question_classes[:20], error_rates)
+        assert np.allclose(reductions, brute_force_reduction(
+            question_classes[:20], error_rates))
+        assert np.all(reductions > -1e-12)
+
+    def test_recommend(self, estimates):
+        question_classes, error_rates, sparse = estimates
+        reductions = brute_force_reduction(question_classes, error_rates)
+        reductions[sparse[:, 0], sparse[:, 1]] = -np.inf
+        questions, workers, gains = active.recommend(
+            question_classes, error_rates, 10, annotations=sparse,
+            max_elements=500)
+        assert len(questions) == 10
+        assert np.all(np.diff(gains) <= 0)
+        assert np.allclose(gains, np.sort(np.max(reductions, 1))[::-1][:10])
+        assert np.allclose(reductions[questions, workers], gains)
+
+    def test_recommend_available_workers(self, estimates):
+        question_classes, error_rates, sparse = estimates
+        questions, workers, gains = active.recommend(
+            question_classes, error_rates, 5, annotations=sparse,
+            workers=[2, 7])
+        assert set(workers) <= set([2, 7])
+        labelled = set(zip(sparse[:, 0], sparse[:, 1]))
+        for question, worker in zip(questions, workers):
+            assert (question, worker) not in labelled
+
+    def test_recommend_no_available_worker(self):
+        question_classes = np.array([[0.5, 0.5]])
+        error_rates = np.array([[[0.9, 0.1], [0.1, 0.9]]])
+        questions, workers, gains = active.recommend(
+            question_classes, error_rates, 3, annotations=[[0, 0, 1]])
+        assert len(questions) == 0
+
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS', 'H', 'MV'])
+    def test_run_return_estimates(self, annotations, algorithm):
+        responses = to_responses(*annotations)
+        args = argparse.Namespace(algorithm=algorithm, verbose=False, seed=1)
+        expected = algorithms.run(responses, args)
+        (result, question_classes, class_marginals,
+         error_rates) = algorithms.run(responses, args, return_estimates=True)
+        assert np.array_equal(result, expected)
+        assert np.allclose(np.sum(question_classes, 1), 1)
+        assert np.isclose(np.sum(class_marginals), 1)
+        assert error_rates.shape == (15, 3, 3)
@@ -0,0 +1,444 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import timeit
+import numpy as np
+import pytest
+from fast_dawid_skene import algorithms
+from fast_dawid_skene.tests.helpers import to_responses
+
+
+class TestHardAssign(object):
+
+    def test_hard_assign_picks_maximum(self):
+        scores = np.array([[0.1, 0.7, 0.2], [3, 1, 2], [0, 0, 5]])
+        assert np.array_equal(algorithms.hard_assign(scores), [
+                              [0, 1, 0], [1, 0, 0], [0, 0, 1]])
+
+    def test_hard_assign_breaks_ties_among_maxima(self):
+        scores = np.tile([2, 0, 2, 1, 2], (3000, 1))
+        question_classes = algorithms.hard_assign(
+            scores, np.random.default_rng(0))
+        assert np.array_equal(np.sum(question_classes, 1), np.ones(3000))
+        frequencies = np.mean(question_classes, 0)
+        assert np.array_equal(frequencies[[1, 3]], [0, 0])
+        assert np.allclose(frequencies[[0, 2, 4]], 1.0 / 3, atol=0.05)
+
+    def test_hard_assign_is_reproducible(self):
+        scores = np.random.RandomState(0).randint(3, size=(100, 4))
+        first = algorithms.hard_assign(scores, np.random.default_rng(5))
+        second = algorithms.hard_assign(scores, np.random.default_rng(5))
+        assert np.array_equal(first, second)
+
+    def test_hard_assign_batches_match_single_call(self):
+        scores = np.random.RandomState(0).randint(3, size=(100, 4))
+        expected = algorithms.hard_assign(scores, np.random.default_rng(5))
+        rng = np.random.default_rng(5)
+        batched = np.vstack([algorithms.hard_assign(scores[:30], rng),
+                             algorithms.hard_assign(scores[30:], rng)])
+        assert np.array_equal(batched, expected)
+
+    def test_hard_assign_infinite_scores(self):
+        scores = np.array([[-np.inf, -np.inf], [-np.inf, 0.0]])
+        question_classes = algorithms.hard_assign(scores)
+        assert np.array_equal(np.sum(question_classes, 1), [1, 1])
+        assert np.array_equal(question_classes[1], [0, 1])
+
+
+class TestRegularization(object):
+
+    def test_pool_participants(self):
+        groups = algorithms.pool_participants([5, 1, 3, 0, 7], 3)
+        assert np.array_equal(groups, [0, 3, 1, 3, 2])
+        assert np.array_equal(
+            algorithms.pool_participants([5, 1, 3], 0), [0, 1, 2])
+
+    def test_smoothed_m_step(self, annotations):
+        responses = to_responses(*annotations)
+        counts = algorithms.responses_to_counts(responses)[3]
+        sparse = algorithms.responses_to_annotations(responses)[3]
+        question_classes = algorithms.initialize(counts, 'FDS')
+        class_marginals, error_rates = algorithms.m_step(
+            counts, question_classes, 0.5)
+        assert np.all(error_rates > 0)
+        assert np.allclose(np.sum(error_rates, 2), 1)
+        sparse_marginals, sparse_error_rates = algorithms.m_step_sparse(
+            sparse, question_classes, 15, smoothing=0.5)
+        assert np.allclose(sparse_marginals, class_marginals)
+        assert np.allclose(sparse_error_rates, error_rates)
+
+    @pytest.mark.parametrize('backend', ['reference', 'numpy'])
+    def test_pooled_run(self, annotations, backend):
+        questions, participants, classes = [list(column)
+                                            for column in annotations]
+        # one-off participants
+        questions += [0, 1, 2]
+        participants += [15, 16, 17]
+        classes += [0, 1, 2]
+        args = argparse.Namespace(algorithm='DS', verbose=False,
+                                  backend=backend, smoothing=0.1,
+                                  pool_threshold=2)
+        (result, _, _, error_rates) = algorithms.run(
+            to_responses(questions, participants, classes), args,
+            return_estimates=True)
+        assert error_rates.shape == (18, 3, 3)
+        assert np.array_equal(error_rates[15], error_rates[16])
+        assert np.array_equal(error_rates[15], error_rates[17])
+        assert not np.array_equal(error_rates[0], error_rates[15])
+
+    def test_pooled_run_backends_agree(self, annotations):
+        responses = to_responses(*annotations)
+        args = argparse.Namespace(algorithm='DS', verbose=False,
+                                  backend='reference', smoothing=0.5,
+                                  pool_threshold=60)
+        (expected, expected_classes, _, expected_error_rates) = algorithms.run(
+            responses, args, return_estimates=True)
+        args.backend = 'numpy'
+        (result, question_classes, _, error_rates) = algorithms.run(
+            responses, args, return_estimates=True)
+        assert np.array_equal(result, expected)
+        assert np.allclose(question_classes, expected_classes)
+        assert np.allclose(error_rates, expected_error_rates)
+
+    @pytest.mark.parametrize('backend', ['reference', 'numpy'])
+    def test_negative_smoothing(self, annotations, backend):
+        args = argparse.Namespace(algorithm='DS', verbose=False,
+                                  backend=backend, smoothing=-0.5)
+        with pytest.raises(AssertionError):
+            algorithms.run(to_responses(*annotations), args)
+
+
+class TestRandomStreams(object):
+
+    def test_make_seed_sequence(self):
+        seed_sequence = np.random.SeedSequence(3)
+        assert algorithms.make_seed_sequence(seed_sequence) is seed_sequence
+        assert algorithms.make_seed_sequence(3).entropy == 3
+        first = algorithms.make_seed_sequence(np.random.default_rng(3))
+        second = algorithms.make_seed_sequence(np.random.default_rng(3))
+        assert np.array_equal(first.generate_state(4),
+                              second.generate_state(4))
+
+    def test_make_generator_skips_questions(self):
+        seed_sequence = np.random.SeedSequence(3)
+        expected = algorithms.make_generator(seed_sequence).random(100)
+        assert np.array_equal(
+            algorithms.make_generator(seed_sequence, 37).random(63),
+            expected[37:])
+
+    def test_step_seed_sequence_keeps_root(self):
+        seed_sequence = np.random.SeedSequence(3)
+        first = algorithms.step_seed_sequence(seed_sequence, 2)
+        second = algorithms.step_seed_sequence(seed_sequence, 2)
+        assert seed_sequence.n_children_spawned == 0
+        assert np.array_equal(first.generate_state(4),
+                              second.generate_state(4))
+        assert not np.array_equal(
+            first.generate_state(4),
+            algorithms.step_seed_sequence(seed_sequence, 1).generate_state(4))
+
+    @pytest.mark.parametrize('backend', ['reference', 'numpy'])
+    def test_run_is_reproducible(self, annotations, backend):
+        responses = to_responses(*annotations)
+        args = argparse.Namespace(algorithm='FDS', verbose=False,
+                                  backend=backend, seed=4)
+        expected = algorithms.run(responses, args)
+        np.random.seed(0)
+        assert np.array_equal(algorithms.run(responses, args), expected)
+        assert np.array_equal(algorithms.run(responses, args, rng=4),
+                              expected)
+        assert np.array_equal(
+            algorithms.run(responses, args, rng=np.random.default_rng(5)),
+            algorithms.run(responses, args, rng=np.random.default_rng(5)))
+        seed_sequence = np.random.SeedSequence(7)
+        assert np.array_equal(
+            algorithms.run(responses, args, rng=seed_sequence),
+            algorithms.run(responses, args, rng=seed_sequence))
+
+
+# Copies of the loops of the original implementation, which the optimized
+# code is checked against. Ties are broken with the global numpy random state.
+
+
+def reference_initialize(counts, mode):
+    [nQuestions, nParticipants, nClasses] = np.shape(counts)
+    response_sums = np.sum(counts, 1)
+    question_classes = np.zeros([nQuestions, nClasses])
+    if mode == 'FDS' or mode == 'MV':
+        for p in range(nQuestions):
+            indices = np.argwhere(response_sums[p, :] == np.max(
+                response_sums[p, :])).flatten()
+            question_classes[p, np.random.choice(indices)] = 1
+    else:
+        for p in range(nQuestions):
+            question_classes[p, :] = response_sums[p, :] / \
+                np.sum(response_sums[p, :], dtype=float)
+
+    return question_classes
+
+
+def reference_m_step(counts, question_classes):
+    [nQuestions, nParticipants, nClasses] = np.shape(counts)
+
+    class_marginals = np.sum(question_classes, 0) / float(nQuestions)
+
+    error_rates = np.zeros([nParticipants, nClasses, nClasses])
+    for k in range(nParticipants):
+        for j in range(nClasses):
+            for l in range(nClasses):
+                error_rates[k, j, l] = np.dot(
+                    question_classes[:, j], counts[:, k, l])
+            sum_over_responses = np.sum(error_rates[k, j, :])
+            if sum_over_responses > 0:
+                error_rates[k, j, :] = error_rates[
+                    k, j, :] / float(sum_over_responses)
+
+    return (class_marginals, error_rates)
+
+
+def reference_e_step(counts, class_marginals, error_rates, mode):
+    [nQuestions, nParticipants, nClasses] = np.shape(counts)
+
+    question_classes = np.zeros([nQuestions, nClasses])
+    final_classes = np.zeros([nQuestions, nClasses])
+
+    for i in range(nQuestions):
+        for j in range(nClasses):
+            estimate = class_marginals[j]
+            estimate *= np.prod(np.power(error_rates[:,
+                                                     j, :], counts[i, :, :]))
+
+            question_classes[i, j] = estimate
+        if mode == 'H' or mode == 'DS':
+            question_sum = np.sum(question_classes[i, :])
+            if question_sum > 0:
+                question_classes[i, :] = question_classes[
+                    i, :] / float(question_sum)
+        else:
+            indices = np.argwhere(question_classes[i, :] == np.max(
+                question_classes[i, :])).flatten()
+            final_classes[i, np.random.choice(indices)] = 1
+
+    if mode == 'H' or mode == 'DS':
+        return question_classes
+    else:
+        return final_classes
+
+
+def reference_calc_likelihood(counts, class_marginals, error_rates):
+    [nPatients, nObservers, nClasses] = np.shape(counts)
+    log_L = 0.0
+
+    for i in range(nPatients):
+        patient_likelihood = 0.0
+        for j in range(nClasses):
+
+            class_prior = class_marginals[j]
+            patient_class_likelihood = np.prod(
+                np.power(error_rates[:, j, :], counts[i, :, :]))
+            patient_class_posterior = class_prior * patient_class_likelihood
+            patient_likelihood += patient_class_posterior
+
+        log_L += np.log(patient_likelihood)
+
+    return log_L
+
+
+def reference_run(responses, mode, tol=0.0001, CM_tol=0.005, max_iter=100):
+    counts = algorithms.responses_to_counts(responses)[3]
+    question_classes = reference_initialize(counts, mode)
+
+    if mode == 'MV':
+        return np.argmax(question_classes, axis=1), None, None
+
+    nIter = 0
+    converged = False
+    old_class_marginals = None
+
+    while not converged:
+        nIter += 1
+        (class_marginals, error_rates) = reference_m_step(
+            counts, question_classes)
+        question_classes = reference_e_step(
+            counts, class_marginals, error_rates, mode)
+
+        if old_class_marginals is not None:
+            class_marginals_diff = np.sum(
+                np.abs(class_marginals - old_class_marginals))
+            if (class_marginals_diff < tol) or nIter >= max_iter:
+                converged = True
+            elif (mode == 'H' and class_marginals_diff <= CM_tol):
+                mode = 'Hphase2'
+
+        old_class_marginals = class_marginals
+
+    return np.argmax(question_classes, axis=1), class_marginals, error_rates
+
+
+def synthetic_annotations(nQuestions, nParticipants, nClasses,
+                          labels_per_question, seed=0):
+    """Annotations of workers of varying accuracy, without majority vote ties"""
+    random_state = np.random.RandomState(seed)
+    accuracies = random_state.uniform(0.5, 0.95, nParticipants)
+    questions, participants, classes = [], [], []
+    nKept = 0
+    for i in range(nQuestions):
+        truth = random_state.randint(nClasses)
+        workers = random_state.choice(
+            nParticipants, labels_per_question, replace=False)
+        correct = random_state.rand(labels_per_question) < accuracies[workers]
+        labels = np.where(correct, truth, random_state.randint(
+            nClasses, size=labels_per_question))
+        votes = np.bincount(labels, minlength=nClasses)
+        if np.sum(votes == np.max(votes)) > 1:
+            continue
+        questions += [nKept] * labels_per_question
+        participants += list(workers)
+        classes += list(labels)
+        nKept += 1
+    return questions, participants, classes
+
+
+class TestParity(object):
+
+    @pytest.mark.parametrize('nClasses', [2, 3])
+    @pytest.mark.parametrize('backend', ['reference', 'numpy', 'numba'])
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS', 'H', 'MV'])
+    def test_run_matches_reference(self, algorithm, backend, nClasses):
+        if backend == 'numba':
+            pytest.importorskip('numba')
+        responses = to_responses(*synthetic_annotations(300, 20, nClasses, 5))
+        np.random.seed(0)
+        (expected, expected_marginals,
+         expected_error_rates) = reference_run(responses, algorithm)
+        args = argparse.Namespace(algorithm=algorithm, verbose=False,
+                                  backend=backend, seed=0)
+        (result, _, class_marginals, error_rates) = algorithms.run(
+            responses, args, return_estimates=True)
+        assert np.array_equal(result, expected)
+        if algorithm != 'MV':
+            assert np.allclose(class_marginals, expected_marginals)
+            assert np.allclose(error_rates, expected_error_rates)
+
+    @pytest.mark.parametrize('mode', ['DS', 'FDS', 'H', 'Hphase2'])
+    def test_steps_match_reference(self, mode):
+        responses = to_responses(*synthetic_annotations(300, 20, 3, 5))
+        counts = algorithms.responses_to_counts(responses)[3]
+        question_classes = reference_initialize(counts, 'DS')
+        assert np.allclose(algorithms.initialize(counts, 'DS'),
+                           question_classes)
+        (class_marginals, error_rates) = reference_m_step(
+            counts, question_classes)
+        (result_marginals, result_error_rates) = algorithms.m_step(
+            counts, question_classes)
+        assert np.allclose(result_marginals, class_marginals)
+        assert np.allclose(result_error_rates, error_rates)
+        assert np.allclose(
+            algorithms.e_step(counts, class_marginals, error_rates, mode),
+            reference_e_step(counts, class_marginals, error_rates, mode))
+        assert np.isclose(
+            algorithms.calc_likelihood(counts, class_marginals, error_rates),
+            reference_calc_likelihood(counts, class_marginals, error_rates))
+
+    def test_calc_likelihood_zero_probability(self):
+        counts = np.array([[[1, 0], [0, 1]], [[0, 1], [0, 1]]])
+        class_marginals = np.array([0.5, 0.5])
+        error_rates = np.array([[[1.0, 0.0], [1.0, 0.0]],
+                                [[0.0, 1.0], [0.0, 1.0]]])
+        assert algorithms.calc_likelihood(
+            counts, class_marginals, error_rates) == -np.inf
+
+    def test_calc_likelihood_many_responses(self):
+        # the likelihood of each class underflows to 0 in the linear domain
+        counts = np.zeros([2, 1, 2])
+        counts[:, 0, 0] = 2000
+        class_marginals = np.array([0.5, 0.5])
+        error_rates = np.array([[[0.6, 0.4], [0.4, 0.6]]])
+        expected = 2 * (np.log(0.5) + 2000 * np.log(0.6) +
+                        np.log1p((0.4 / 0.6) ** 2000))
+        assert np.isclose(algorithms.calc_likelihood(
+            counts, class_marginals, error_rates), expected)
+
+
+def best_time(function, repeat=3):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+@pytest.fixture(scope='module')
+def medium_problem():
+    responses = to_responses(*synthetic_annotations(2000, 40, 3, 5))
+    counts = algorithms.responses_to_counts(responses)[3]
+    sparse = algorithms.responses_to_annotations(responses)[3]
+    question_classes = algorithms.initialize(counts, 'DS')
+    class_marginals, error_rates = algorithms.m_step(counts, question_classes)
+    return (responses, counts, sparse, question_classes, class_marginals,
+            error_rates)
+
+
+class TestPerformance(object):
+    # The thresholds are several times below the speedups measured on a
+    # laptop, so that they only fail on regressions
+
+    def test_e_step_sparse_speedup(self, medium_problem):
+        (_, counts, sparse, _, class_marginals, error_rates) = medium_problem
+        nQuestions = len(counts)
+        reference_time = best_time(lambda: reference_e_step(
+            counts, class_marginals, error_rates, 'DS'))
+        sparse_time = best_time(lambda: algorithms.e_step_sparse(
+            sparse, class_marginals, error_rates, 'DS', nQuestions))
+        assert sparse_time * 10 < reference_time
+
+    def test_m_step_sparse_speedup(self, medium_problem):
+        (_, counts, sparse, question_classes, _, _) = medium_problem
+        nParticipants = np.shape(counts)[1]
+        reference_time = best_time(lambda: reference_m_step(
+            counts, question_classes))
+        sparse_time = best_time(lambda: algorithms.m_step_sparse(
+            sparse, question_classes, nParticipants))
+        assert sparse_time * 2 < reference_time
+
+    def test_hard_assign_speedup(self, medium_problem):
+        (_, counts, _, _, _, _) = medium_problem
+        reference_time = best_time(lambda: reference_initialize(counts, 'FDS'))
+        batched_time = best_time(lambda: algorithms.initialize(
+            counts, 'FDS', np.random.default_rng(0)))
+        assert batched_time * 2 < reference_time
+
+    def test_calc_likelihood_no_slower(self, medium_problem):
+        (_, counts, _, _, class_marginals, error_rates) = medium_problem
+        reference_time = best_time(lambda: reference_calc_likelihood(
+            counts, class_marginals, error_rates))
+        log_domain_time = best_time(lambda: algorithms.calc_likelihood(
+            counts, class_marginals, error_rates))
+        assert log_domain_time < 2 * reference_time
+
+    def test_run_numpy_speedup(self, medium_problem):
+        (responses, _, _, _, _, _) = medium_problem
+        args = argparse.Namespace(algorithm='DS', verbose=False,
+                                  backend='reference', seed=0)
+        reference_time = best_time(lambda: algorithms.run(
+            responses, args, max_iter=3), repeat=1)
+        args.backend = 'numpy'
+        numpy_time = best_time(lambda: algorithms.run(
+            responses, args, max_iter=3), repeat=1)
+        assert numpy_time * 5 < reference_time
@@ -0,0 +1,148 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import multiprocessing
+import numpy as np
+import pytest
+from fast_dawid_skene import cli, distributed, shards
+
+
+def square(x):
+    return x * x
+
+
+def fail(x):
+    raise ValueError("failed on " + str(x))
+
+
+def fail_first(x):
+    if x == 0:
+        raise ValueError("failed on 0")
+    return x * x
+
+
+def run_with_backend(annotations, shard_dir, backend, algorithm):
+    store = shards.write_shards(*annotations, shard_dir=shard_dir,
+                                questions_per_shard=23)
+    args = argparse.Namespace(algorithm=algorithm, verbose=False, seed=1)
+    try:
+        return shards.run(store, args, executor=backend)
+    finally:
+        backend.close()
+
+
+def start_workers(backend, count):
+    workers = [multiprocessing.Process(target=distributed.serve, args=(
+        backend.address, backend.authkey)) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+class TestDistributed(object):
+
+    def test_serial_backend_map(self):
+        backend = distributed.SerialBackend()
+        assert list(backend.map(square, range(5))) == [0, 1, 4, 9, 16]
+
+    def test_multiprocessing_backend_map(self):
+        backend = distributed.MultiprocessingBackend(2)
+        try:
+            assert list(backend.map(square, range(5))) == [0, 1, 4, 9, 16]
+        finally:
+            backend.close()
+
+    def test_socket_backend_map(self):
+        backend = distributed.SocketBackend(3)
+        workers = start_workers(backend, 3)
+        try:
+            assert list(backend.map(square, range(10))) == [
+                x * x for x in range(10)]
+            assert list(backend.map(square, range(2))) == [0, 1]
+        finally:
+            backend.close()
+        for worker in workers:
+            worker.join()
+            assert worker.exitcode == 0
+
+    def test_socket_backend_task_error(self):
+        backend = distributed.SocketBackend(1)
+        workers = start_workers(backend, 1)
+        try:
+            with pytest.raises(RuntimeError):
+                list(backend.map(fail, range(1)))
+        finally:
+            backend.close()
+        workers[0].join()
+
+    def test_socket_backend_task_error_in_flight(self):
+        backend = distributed.SocketBackend(3)
+        workers = start_workers(backend, 3)
+        try:
+            with pytest.raises(RuntimeError):
+                list(backend.map(fail_first, range(10)))
+            assert list(backend.map(square, range(6, 10))) == [
+                36, 49, 64, 81]
+        finally:
+            backend.close()
+        for worker in workers:
+            worker.join()
+
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS', 'H', 'MV'])
+    def test_backends_agree(self, annotations, tmpdir, algorithm):
+        expected = run_with_backend(annotations, str(tmpdir.join('serial')),
+                                    distributed.SerialBackend(), algorithm)
+
+        result = run_with_backend(annotations, str(tmpdir.join('pool')),
+                                  distributed.MultiprocessingBackend(2),
+                                  algorithm)
+        assert np.array_equal(result, expected)
+
+        backend = distributed.SocketBackend(2)
+        workers = start_workers(backend, 2)
+        result = run_with_backend(annotations, str(tmpdir.join('socket')),
+                                  backend, algorithm)
+        for worker in workers:
+            worker.join()
+        assert np.array_equal(result, expected)
+
+    def test_create_backend(self):
+        assert distributed.create_backend('serial') is None
+        with pytest.raises(AssertionError):
+            distributed.create_backend('threads')
+
+    def test_socket_backend_random_authkey(self):
+        first = distributed.create_backend('socket', 1, 'localhost:0')
+        second = distributed.create_backend('socket', 1, 'localhost:0')
+        try:
+            assert len(first.authkey) == 32
+            assert first.authkey != second.authkey
+        finally:
+            first.close()
+            second.close()
+        with pytest.raises(SystemExit):
+            cli.worker(['--address', 'localhost:5018'])
+
+    def test_parse_address(self):
+        assert distributed.parse_address('localhost:5018') == (
+            'localhost', 5018)
@@ -0,0 +1,145 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import numpy as np
+import pytest
+from fast_dawid_skene import algorithms, cli, estimates, shards
+from fast_dawid_skene.tests.helpers import to_responses
+
+
+class TestEstimates(object):
+
+    def test_write_and_load_estimates(self, tmpdir):
+        estimates_dir = str(tmpdir.join('estimates'))
+        posteriors = np.array([[0.9, 0.1], [0.2, 0.8], [0.5, 0.5]])
+        error_rates = np.tile(np.eye(2), (4, 1, 1))
+        estimates.write_estimates(
+            estimates_dir, np.array([0, 1, 0]), posteriors,
+            np.array([0.4, 0.6]), error_rates,
+            question_dict={0: 'q0', 1: 'q1', 2: 'q2'},
+            annotation_dict={0: 'neg', 1: 1}, algorithm='DS')
+        manifest, arrays = estimates.load_estimates(estimates_dir)
+        assert manifest['algorithm'] == 'DS'
+        assert manifest['nQuestions'] == 3
+        assert manifest['nParticipants'] == 4
+        assert manifest['nClasses'] == 2
+        assert 'annotator_ids' not in arrays
+        for name in ['labels', 'posteriors', 'class_marginals', 'error_rates',
+                     'question_ids', 'annotation_ids']:
+            assert isinstance(arrays[name], np.memmap)
+            assert list(arrays[name].shape) == manifest['arrays'][name]['shape']
+        assert np.array_equal(arrays['posteriors'], posteriors)
+        assert np.array_equal(arrays['error_rates'], error_rates)
+        assert arrays['question_ids'].tolist() == ['q0', 'q1', 'q2']
+        assert arrays['annotation_ids'].tolist() == ['neg', '1']
+
+    def test_load_estimates_missing_manifest(self, tmpdir):
+        with pytest.raises(AssertionError):
+            estimates.load_estimates(str(tmpdir))
+
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS', 'H', 'MV'])
+    def test_shards_estimates_match_in_memory(self, annotations, tmpdir,
+                                              algorithm):
+        args = argparse.Namespace(algorithm=algorithm, verbose=False, seed=1,
+                                  backend='numpy')
+        expected = algorithms.run(to_responses(*annotations), args,
+                                  return_estimates=True)
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir),
+                                    questions_per_shard=37)
+        posteriors_path = str(tmpdir.join('estimates.npy'))
+        result = shards.run(store, args, posteriors_path=posteriors_path,
+                            return_estimates=True)
+        assert np.array_equal(result[0], expected[0])
+        assert isinstance(result[1], np.memmap)
+        assert result[1].filename.endswith('estimates.npy')
+        for value, expected_value in zip(result[1:], expected[1:]):
+            assert np.allclose(value, expected_value)
+
+    @pytest.mark.parametrize('sharded', [False, True])
+    def test_cli_writes_estimates(self, annotations, tmpdir, sharded):
+        questions, participants, classes = [list(column)
+                                            for column in annotations]
+        # an annotator whose only annotation is dropped with k = 4
+        questions.append(0)
+        participants.append(15)
+        classes.append(2)
+        encoded_path = str(tmpdir.join('encoded.npz'))
+        np.savez(encoded_path, questions=questions, annotators=participants,
+                 annotations=classes,
+                 annotator_ids=np.array(['w%d' % k for k in range(16)]))
+        estimates_dir = str(tmpdir.join('estimates'))
+        argv = ['--encoded_path', encoded_path, '--k', '4', '--algorithm',
+                'FDS', '--estimates_dir', estimates_dir]
+        if sharded:
+            argv += ['--shard_dir', str(tmpdir.join('shards')),
+                     '--shard_size', '64']
+        cli.main(argv)
+
+        manifest, arrays = estimates.load_estimates(estimates_dir)
+        assert manifest['nParticipants'] == 16
+        assert arrays['posteriors'].shape == (200, 3)
+        assert np.allclose(np.sum(arrays['posteriors'], 1), 1)
+        assert np.array_equal(np.argmax(arrays['posteriors'], 1),
+                              arrays['labels'])
+        assert arrays['error_rates'].shape == (16, 3, 3)
+        assert not np.any(arrays['error_rates'][15])
+        assert arrays['annotator_ids'][15] == 'w15'
+        assert arrays['question_ids'].tolist() == list(range(200))
+
+    @pytest.mark.parametrize('sharded', [False, True])
+    def test_cli_dropped_class(self, tmpdir, sharded):
+        # the only label X is dropped with k = 2
+        encoded_path = str(tmpdir.join('encoded.npz'))
+        np.savez(encoded_path, questions=[0, 0, 0, 1, 1, 1],
+                 annotators=[0, 1, 2, 0, 1, 2],
+                 annotations=[2, 2, 1, 0, 0, 0],
+                 annotation_ids=np.array(['A', 'X', 'B']))
+        estimates_dir = str(tmpdir.join('estimates'))
+        argv = ['--encoded_path', encoded_path, '--k', '2', '--algorithm',
+                'DS', '--estimates_dir', estimates_dir]
+        if sharded:
+            argv += ['--shard_dir', str(tmpdir.join('shards'))]
+        cli.main(argv)
+
+        _, arrays = estimates.load_estimates(estimates_dir)
+        assert arrays['posteriors'].shape == (2, 3)
+        assert np.array_equal(np.argmax(arrays['posteriors'], 1),
+                              arrays['labels'])
+        assert arrays['annotation_ids'][arrays['labels']].tolist() == [
+            'B', 'A']
+
+    def test_cli_estimates_in_shard_dir(self, annotations, tmpdir):
+        encoded_path = str(tmpdir.join('encoded.npz'))
+        np.savez(encoded_path, questions=annotations[0],
+                 annotators=annotations[1], annotations=annotations[2])
+        directory = str(tmpdir.join('shards'))
+        argv = ['--algorithm', 'FDS', '--shard_dir', directory,
+                '--shard_size', '64', '--estimates_dir', directory]
+        cli.main(argv + ['--encoded_path', encoded_path])
+        _, written = estimates.load_estimates(directory, mmap_mode=None)
+        # the shards are still readable after writing the estimates
+        assert len(shards.ShardStore(directory)) == 4
+        cli.main(argv)
+        _, reused = estimates.load_estimates(directory)
+        assert np.array_equal(reused['labels'], written['labels'])
+        assert np.array_equal(reused['posteriors'], written['posteriors'])
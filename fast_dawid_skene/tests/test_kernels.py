@@ -0,0 +1,139 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from fast_dawid_skene import algorithms, kernels
+from fast_dawid_skene.tests.helpers import to_responses
+
+
+@pytest.fixture()
+def problem(annotations):
+    responses = to_responses(*annotations)
+    counts = algorithms.responses_to_counts(responses)[3]
+    sparse = algorithms.responses_to_annotations(responses)[3]
+    question_classes = algorithms.initialize(counts, 'DS')
+    class_marginals, error_rates = algorithms.m_step(counts, question_classes)
+    return counts, sparse, question_classes, class_marginals, error_rates
+
+
+class TestKernels(object):
+
+    def test_responses_to_annotations(self, annotations):
+        responses = to_responses(*annotations)
+        counts = algorithms.responses_to_counts(responses)[3]
+        sparse = algorithms.responses_to_annotations(responses)[3]
+        dense = np.zeros(counts.shape)
+        np.add.at(dense, (sparse[:, 0], sparse[:, 1], sparse[:, 2]), 1)
+        assert np.array_equal(dense, counts)
+
+    def test_m_step_sparse_matches_m_step(self, problem):
+        counts, sparse, question_classes, class_marginals, error_rates = problem
+        result = algorithms.m_step_sparse(sparse, question_classes, 15)
+        assert np.allclose(result[0], class_marginals)
+        assert np.allclose(result[1], error_rates)
+
+    def test_e_step_sparse_matches_e_step(self, problem):
+        counts, sparse, _, class_marginals, error_rates = problem
+        question_classes, log_L = algorithms.e_step_sparse(
+            sparse, class_marginals, error_rates, 'DS')
+        assert np.allclose(question_classes, algorithms.e_step(
+            counts, class_marginals, error_rates, 'DS'))
+        assert np.isclose(log_L, algorithms.calc_likelihood(
+            counts, class_marginals, error_rates))
+
+    def test_loops_match_numpy(self, problem):
+        _, sparse, question_classes, class_marginals, error_rates = problem
+        expected = kernels.log_joint(sparse, 200, class_marginals, error_rates)
+        log_joint = np.empty([200, 3])
+        with np.errstate(divide='ignore'):
+            kernels._log_joint_loop(sparse, np.log(class_marginals),
+                                    np.log(error_rates), log_joint)
+        assert np.allclose(log_joint, expected)
+
+        expected_classes, expected_log_L = kernels.posteriors(log_joint)
+        posteriors = np.empty_like(log_joint)
+        log_L = kernels._posteriors_loop(log_joint, posteriors)
+        assert np.allclose(posteriors, expected_classes)
+        assert np.isclose(log_L, expected_log_L)
+
+        expected_sums, expected_counts = kernels.accumulate(
+            sparse, question_classes, 15)
+        class_sums = np.zeros(3)
+        error_counts = np.zeros([15, 3, 3])
+        kernels._accumulate_loop(sparse, question_classes, class_sums,
+                                 error_counts)
+        assert np.allclose(class_sums, expected_sums)
+        assert np.allclose(error_counts, expected_counts)
+
+    def test_posteriors_zero_probability(self):
+        log_joint = np.array([[0.0, -np.inf], [-np.inf, -np.inf]])
+        question_classes, log_L = kernels.posteriors(log_joint)
+        assert np.array_equal(question_classes, [[1, 0], [0, 0]])
+        assert log_L == -np.inf
+
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS', 'H', 'MV'])
+    def test_run_numpy_matches_reference(self, annotations, algorithm):
+        responses = to_responses(*annotations)
+        args = argparse.Namespace(algorithm=algorithm, verbose=False,
+                                  backend='reference', seed=1)
+        expected = algorithms.run(responses, args)
+        args.backend = 'numpy'
+        assert np.array_equal(algorithms.run(responses, args), expected)
+
+    def test_numba_matches_numpy(self, problem):
+        pytest.importorskip('numba')
+        _, sparse, question_classes, class_marginals, error_rates = problem
+        log_joint = kernels.log_joint(sparse, 200, class_marginals,
+                                      error_rates, 'numba')
+        assert np.allclose(log_joint, kernels.log_joint(
+            sparse, 200, class_marginals, error_rates))
+        numba_posteriors = kernels.posteriors(log_joint, 'numba')
+        numpy_posteriors = kernels.posteriors(log_joint)
+        assert np.allclose(numba_posteriors[0], numpy_posteriors[0])
+        assert np.isclose(numba_posteriors[1], numpy_posteriors[1])
+        numba_statistics = kernels.accumulate(
+            sparse, question_classes, 15, 'numba')
+        numpy_statistics = kernels.accumulate(sparse, question_classes, 15)
+        assert np.allclose(numba_statistics[0], numpy_statistics[0])
+        assert np.allclose(numba_statistics[1], numpy_statistics[1])
+
+    def test_numba_fallback(self, monkeypatch):
+        monkeypatch.setattr(kernels, '_import_numba', lambda: None)
+        with pytest.warns(UserWarning):
+            assert kernels.resolve_backend('numba') == 'numpy'
+
+    def test_numba_not_imported(self):
+        # Numba is slow to import, and only imported when the backend is used
+        code = ("import sys; import fast_dawid_skene.main; "
+                "assert 'numba' not in sys.modules")
+        root_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        subprocess.check_call([sys.executable, '-c', code], cwd=root_dir)
+
+    def test_invalid_backend(self):
+        with pytest.raises(AssertionError):
+            kernels.resolve_backend('cuda')
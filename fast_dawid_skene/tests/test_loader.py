@@ -22,15 +22,14 @@ SOFTWARE.
 
 import os
 import sys
-import loader
 import numpy as np
 import pytest
-import config
+from fast_dawid_skene import loader
 
 
 @pytest.fixture()
 def setup():
-    data_path = os.path.join(config.root_dir, 'data')
+    data_path = os.path.join(loader.root_dir, 'data')
     toy_dataset_path = os.path.join(data_path, 'toy_dataset')
     toy_crowd_path = os.path.join(toy_dataset_path, 'crowd.csv')
     toy_gt_path = os.path.join(toy_dataset_path, 'gold.csv')
@@ -60,6 +59,15 @@ class TestLoader(object):
         with pytest.raises(AssertionError):
             l = loader.DataLoader('toy', 2, 'mode')
 
+    def test_loader_installed_package(self, setup, monkeypatch, tmpdir):
+        # installed packages have no data directory
+        toy_dataset_path = os.path.join(loader.root_dir, 'data', 'toy_dataset')
+        monkeypatch.setattr(loader, 'root_dir', str(tmpdir))
+        with pytest.raises(AssertionError):
+            l = loader.DataLoader('toy', 2, 'aggregate')
+        l = loader.DataLoader('toy', 2, 'aggregate', toy_dataset_path)
+        assert l.num_questions == 3
+
     def test_loader_invalid_annotator_count(self, setup):
         with pytest.raises(AssertionError):
             l = loader.DataLoader('toy', 30, 'aggregate')
@@ -107,3 +115,60 @@ class TestLoader(object):
         l = loader.DataLoader('toy', 2, 'aggregate')
         assert isinstance(l.get_ind_to_question_dict(), dict)
         assert isinstance(l.get_ind_to_annotation_dict(), dict)
+
+    def test_encoded_loader_matches_loader(self, setup, tmpdir):
+        l = loader.DataLoader('toy', 0, 'test')
+        encoded_path = str(tmpdir.join('toy.npz'))
+        l.save_encoded(encoded_path)
+        for k in [0, 1, 2]:
+            l.set_k(k)
+            encoded = loader.EncodedDataLoader(encoded_path, k, 'test')
+            data, gt = l.get_data()
+            encoded_data, encoded_gt = encoded.get_data()
+            assert encoded_data == data
+            assert np.array_equal(encoded_gt, gt)
+            annotations, _ = l.get_annotations()
+            encoded_annotations, _ = encoded.get_annotations()
+            for column, encoded_column in zip(annotations, encoded_annotations):
+                assert np.array_equal(column, encoded_column)
+        assert encoded.get_ind_to_question_dict() == l.get_ind_to_question_dict()
+        assert encoded.get_ind_to_annotation_dict() == l.get_ind_to_annotation_dict()
+
+    @pytest.mark.parametrize('chunksize', [1, 3, 100])
+    def test_chunked_loader_matches_loader(self, setup, chunksize):
+        l = loader.DataLoader('toy', 0, 'test')
+        for k in [0, 1, 2]:
+            l.set_k(k)
+            chunked = loader.ChunkedDataLoader('toy', k, 'test',
+                                               chunksize=chunksize)
+            chunks = list(chunked.get_annotation_chunks())
+            (annotations, gt) = l.get_annotations()
+            for column, chunked_columns in zip(annotations, zip(*chunks)):
+                assert np.array_equal(column, np.concatenate(chunked_columns))
+            assert np.array_equal(chunked.get_gold(), gt)
+            assert chunked.num_questions == l.num_questions
+            assert chunked.num_annotators == l.num_annotators
+            assert chunked.num_options == l.num_options
+            assert chunked.get_ind_to_question_dict() == l.get_ind_to_question_dict()
+            assert chunked.get_ind_to_annotator_dict() == l.get_ind_to_annotator_dict()
+            assert chunked.get_ind_to_annotation_dict() == l.get_ind_to_annotation_dict()
+
+    def test_chunked_loader_invalid_annotator_count(self, setup):
+        chunked = loader.ChunkedDataLoader('toy', 30, 'aggregate', chunksize=2)
+        with pytest.raises(AssertionError):
+            list(chunked.get_annotation_chunks())
+
+    def test_encoded_loader_without_vocabularies(self, tmpdir):
+        encoded_path = str(tmpdir.join('encoded.npz'))
+        np.savez(encoded_path, questions=[0, 0, 1, 2, 1],
+                 annotators=[0, 1, 0, 0, 2], annotations=[0, 0, 1, 2, 3])
+        l = loader.EncodedDataLoader(encoded_path, 0, 'aggregate')
+        data, gt = l.get_data()
+        assert data == {0: {0: [0], 1: [0]}, 1: {
+            0: [1], 2: [3]}, 2: {0: [2]}}
+        assert gt is None
+        assert l.get_ind_to_annotation_dict() == {0: 0, 1: 1, 2: 2, 3: 3}
+        with pytest.raises(AssertionError):
+            loader.EncodedDataLoader(encoded_path, 2, 'aggregate')
+        with pytest.raises(AssertionError):
+            loader.EncodedDataLoader(encoded_path, 0, 'test')
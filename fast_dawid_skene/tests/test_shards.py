@@ -0,0 +1,176 @@
+"""
+Copyright (c) 2018 Vaibhav B Sinha, Sukrut Rao, Vineeth N Balasubramanian
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import numpy as np
+import pytest
+from fast_dawid_skene import algorithms, cli, estimates, shards
+from fast_dawid_skene.tests.helpers import to_responses
+
+
+class TestShards(object):
+
+    def test_write_shards(self, annotations, tmpdir):
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir),
+                                    questions_per_shard=64)
+        assert store.nQuestions == 200
+        assert store.nParticipants == 15
+        assert store.nClasses == 3
+        assert len(store) == 4
+        total = 0
+        for start, stop, shard_annotations in store:
+            assert isinstance(shard_annotations, np.memmap)
+            assert np.all(shard_annotations[:, 0] < stop - start)
+            total += len(shard_annotations)
+        assert total == len(annotations[0])
+
+    def test_shard_writer_chunks(self, annotations, tmpdir):
+        store = shards.write_shards(*annotations,
+                                    shard_dir=str(tmpdir.join('all')),
+                                    questions_per_shard=64)
+        # chunks in reverse order of questions
+        writer = shards.ShardWriter(str(tmpdir.join('chunks')), 64)
+        columns = [np.asarray(column)[::-1] for column in annotations]
+        for start in range(0, len(columns[0]), 97):
+            writer.append(*[column[start:start + 97] for column in columns])
+        chunked_store = writer.close()
+        assert chunked_store.nQuestions == 200
+        assert chunked_store.nParticipants == 15
+        assert chunked_store.nClasses == 3
+        assert not tmpdir.join('chunks').listdir('*.part')
+        for shard, chunked_shard in zip(store, chunked_store):
+            assert shard[:2] == chunked_shard[:2]
+            # sorted by question, in reverse input order within questions
+            assert np.array_equal(shard[2][:, 0], chunked_shard[2][:, 0])
+            assert sorted(map(tuple, shard[2])) == \
+                sorted(map(tuple, chunked_shard[2]))
+
+    def test_write_shards_missing_manifest(self, tmpdir):
+        with pytest.raises(AssertionError):
+            shards.ShardStore(str(tmpdir))
+
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS', 'H', 'MV'])
+    def test_run_matches_in_memory(self, annotations, tmpdir, algorithm):
+        args = argparse.Namespace(algorithm=algorithm, verbose=False, seed=1)
+        expected = algorithms.run(to_responses(*annotations), args)
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir),
+                                    questions_per_shard=37)
+        result = shards.run(store, args)
+        assert np.array_equal(result, expected)
+        posteriors = np.load(str(tmpdir.join('posteriors.npy')), mmap_mode='r')
+        assert posteriors.shape == (200, 3)
+        assert np.array_equal(np.argmax(posteriors, axis=1), result)
+
+    @pytest.mark.parametrize('algorithm', ['H', 'MV'])
+    def test_main_matches_in_memory(self, annotations, tmpdir, algorithm):
+        args = argparse.Namespace(algorithm=algorithm, verbose=False, seed=1,
+                                  backend='numpy')
+        gold = np.asarray(annotations[2])[
+            np.searchsorted(annotations[0], np.arange(200))]
+        expected = algorithms.main(args, to_responses(*annotations), gold,
+                                   return_estimates=True)
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir),
+                                    questions_per_shard=37)
+        result = algorithms.main(args, store, gold, return_estimates=True,
+                                 estimator=shards.run)
+        assert np.array_equal(result[0], expected[0])
+        assert result[1] == expected[1]
+        for value, expected_value in zip(result[2], expected[2]):
+            assert np.allclose(value, expected_value)
+
+    @pytest.mark.parametrize('algorithm', ['DS', 'FDS'])
+    def test_run_pooled_matches_in_memory(self, annotations, tmpdir,
+                                          algorithm):
+        args = argparse.Namespace(algorithm=algorithm, verbose=False,
+                                  backend='numpy', smoothing=0.5,
+                                  pool_threshold=55, seed=1)
+        expected = algorithms.run(to_responses(*annotations), args)
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir),
+                                    questions_per_shard=37)
+        assert np.array_equal(shards.run(store, args), expected)
+
+    def test_run_negative_smoothing(self, annotations, tmpdir):
+        args = argparse.Namespace(algorithm='DS', verbose=False,
+                                  smoothing=-0.5)
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir))
+        with pytest.raises(AssertionError):
+            shards.run(store, args)
+
+    @pytest.mark.parametrize('algorithm', ['FDS', 'MV'])
+    def test_run_does_not_depend_on_shard_size(self, annotations, tmpdir,
+                                               algorithm):
+        args = argparse.Namespace(algorithm=algorithm, verbose=False)
+        expected = algorithms.run(to_responses(*annotations), args,
+                                  rng=np.random.SeedSequence(7))
+        for size in [7, 64, 200]:
+            store = shards.write_shards(*annotations,
+                                        shard_dir=str(tmpdir.join(str(size))),
+                                        questions_per_shard=size)
+            result = shards.run(store, args, rng=np.random.SeedSequence(7))
+            assert np.array_equal(result, expected)
+
+    @pytest.mark.parametrize('algorithm', ['FDS', 'MV'])
+    def test_run_reuses_seed_sequence(self, annotations, tmpdir, algorithm):
+        args = argparse.Namespace(algorithm=algorithm, verbose=False)
+        seed_sequence = np.random.SeedSequence(7)
+        expected = algorithms.run(to_responses(*annotations), args,
+                                  rng=seed_sequence)
+        store = shards.write_shards(*annotations, shard_dir=str(tmpdir),
+                                    questions_per_shard=37)
+        assert np.array_equal(shards.run(store, args, rng=seed_sequence),
+                              expected)
+        assert np.array_equal(shards.run(store, args, rng=seed_sequence),
+                              expected)
+
+    def test_cli_streams_csv_to_shards(self, annotations, tmpdir):
+        crowd_path = tmpdir.join('crowd.csv')
+        crowd_path.write(''.join('w%d,q%d,c%d\n' % (k, i, j) for i, k, j
+                                 in zip(*annotations)))
+        argv = ['--dataset', 'crowd', '--crowd_annotations_path',
+                str(crowd_path), '--algorithm', 'FDS']
+        cli.main(argv + ['--estimates_dir', str(tmpdir.join('in_memory'))])
+        cli.main(argv + ['--estimates_dir', str(tmpdir.join('streamed')),
+                         '--shard_dir', str(tmpdir.join('shards')),
+                         '--shard_size', '64', '--chunk_size', '97'])
+        _, in_memory = estimates.load_estimates(str(tmpdir.join('in_memory')))
+        _, streamed = estimates.load_estimates(str(tmpdir.join('streamed')))
+        assert np.array_equal(streamed['labels'], in_memory['labels'])
+        assert np.allclose(streamed['posteriors'], in_memory['posteriors'])
+        for name in ['question_ids', 'annotator_ids', 'annotation_ids']:
+            assert np.array_equal(streamed[name], in_memory[name])
+
+    def test_cli_reuses_shards(self, annotations, tmpdir):
+        encoded_path = str(tmpdir.join('encoded.npz'))
+        np.savez(encoded_path, questions=annotations[0],
+                 annotators=annotations[1], annotations=annotations[2],
+                 question_ids=np.array(['q%d' % i for i in range(200)]))
+        shard_dir = str(tmpdir.join('shards'))
+        argv = ['--algorithm', 'FDS', '--shard_dir', shard_dir,
+                '--shard_size', '64']
+        cli.main(argv + ['--encoded_path', encoded_path, '--estimates_dir',
+                         str(tmpdir.join('written'))])
+        cli.main(argv + ['--estimates_dir', str(tmpdir.join('reused'))])
+        _, written = estimates.load_estimates(str(tmpdir.join('written')))
+        _, reused = estimates.load_estimates(str(tmpdir.join('reused')))
+        assert np.array_equal(reused['labels'], written['labels'])
+        assert np.allclose(reused['posteriors'], written['posteriors'])
+        assert reused['question_ids'][5] == 'q5'
@@ -26,6 +26,11 @@ import csv
 import os
 import numpy as np
 
+# names of the files describing the arrays in a directory of shards and in a
+# directory of estimates. They differ, so that both can share a directory
+SHARDS_MANIFEST_NAME = 'shards.json'
+ESTIMATES_MANIFEST_NAME = 'estimates.json'
+
 
 def to_csv(result, output_path, question_dict=None, annotation_dict=None, delimiter=','):
     output_dir = os.path.dirname(output_path)
@@ -40,3 +45,41 @@ def to_csv(result, output_path, question_dict=None, annotation_dict=None, delimi
             annotation = annotation_dict[annotation]
         output_writer.writerow([question, annotation])
     output_file.close()
+
+
+def print_predictions(result, question_dict=None, annotation_dict=None):
+    """
+    Prints the predictions as a table of questions and annotations
+
+    Args:
+        result: The estimated label for each question: [nQuestions]
+        question_dict: Index to question dictionary
+        annotation_dict: Index to annotation dictionary
+    """
+    rows = [('', 'Question', 'Annotation')]
+    for index, annotation in np.ndenumerate(result):
+        question = index[0]
+        if question_dict is not None:
+            question = question_dict[question]
+        if annotation_dict is not None:
+            annotation = annotation_dict[annotation]
+        rows.append((str(index[0]), str(question), str(annotation)))
+    widths = [max(len(row[column]) for row in rows) for column in range(3)]
+    for row in rows:
+        print(' '.join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def vocabulary(ind_to_val_dict):
+    """
+    Converts an index to value dictionary into an array of values
+
+    Args:
+        ind_to_val_dict: Dictionary from each index in range(n) to a value
+
+    Returns:
+        Array of the values, ordered by index, or None if ind_to_val_dict is
+        None
+    """
+    if ind_to_val_dict is None:
+        return None
+    return np.array([ind_to_val_dict[ind] for ind in range(len(ind_to_val_dict))])
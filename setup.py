@@ -0,0 +1,18 @@
+from setuptools import setup
+
+setup(
+    name='fast-dawid-skene',
+    version='0.1.0',
+    description='Fast Dawid-Skene: A Fast Vote Aggregation Scheme for Sentiment Classification',
+    url='https://github.com/sukrutrao/Fast-Dawid-Skene',
+    license='MIT',
+    packages=['fast_dawid_skene'],
+    install_requires=['numpy', 'pandas'],
+    extras_require={'numba': ['numba']},
+    entry_points={
+        'console_scripts': [
+            'fast-dawid-skene=fast_dawid_skene.cli:main',
+            'fast-dawid-skene-worker=fast_dawid_skene.cli:worker',
+        ],
+    },
+)